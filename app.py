@@ -1,12 +1,25 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_file, jsonify, session
+from flask import (Flask, render_template, request, redirect, url_for, flash, send_from_directory, jsonify, session,
+                   Response, stream_with_context)
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from datetime import datetime, date
+import hashlib
+import itertools
+import mimetypes
 import os
+import secrets
+import shutil
 from config import Config
-from models import db, User, Conversion, CreditTransaction, GuestConversion
-from utils.pdf_converter import convert_pdf_to_excel, count_pdf_pages
+from models import db, User, Conversion, CreditTransaction
+from utils.uploads import check_signature, inspect_upload, extract_zip_statements, batch_file_name
+from utils.pagination import keyset_page
 from utils.auth import login_required_with_message, check_daily_bonus
+from utils.jobs import ConversionQueue
+from utils.guest_quota import GuestQuotaStore
+from utils.admission import AdmissionControl
+from utils.retention import RetentionSweeper
+from utils.exporters import OUTPUT_FORMATS, STREAM_FORMATS
+from utils.metrics import time_stage, render_metrics, REQUEST_SECONDS
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -16,6 +29,10 @@ db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+guest_quota = GuestQuotaStore(app)
+admission = AdmissionControl(app)
+conversion_queue = ConversionQueue(app, guest_quota=guest_quota, admission=admission)
+retention_sweeper = RetentionSweeper(app)
 
 # Create upload and converted folders
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -29,33 +46,91 @@ def load_user(user_id):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+def save_upload(file, upload_path, chunk_size=64 * 1024):
+    """Save the uploaded file, hashing it on the way; returns (SHA-256 hex digest, error)
+    
+    The first chunk is checked against the extension's file signature,
+    so a mislabelled upload is rejected before the rest is read.
+    """
+    digest = hashlib.sha256()
+    with time_stage('save_upload'), open(upload_path, 'wb') as destination:
+        first_chunk = True
+        while True:
+            chunk = file.stream.read(chunk_size)
+            if not chunk:
+                break
+            if first_chunk:
+                error = check_signature(upload_path, chunk)
+                if error:
+                    return None, error
+                first_chunk = False
+            digest.update(chunk)
+            destination.write(chunk)
+    
+    if first_chunk:
+        return None, 'Uploaded file is empty'
+    return digest.hexdigest(), None
+
 def get_client_ip():
     """Get client IP address"""
     if request.headers.get('X-Forwarded-For'):
         return request.headers.get('X-Forwarded-For').split(',')[0]
     return request.remote_addr
 
-def check_guest_limit(ip_address):
-    """Check if guest has remaining conversions this month"""
-    month_year = datetime.now().strftime('%Y-%m')
-    guest = GuestConversion.query.filter_by(ip_address=ip_address, month_year=month_year).first()
-    
-    if not guest:
-        guest = GuestConversion(ip_address=ip_address, month_year=month_year, conversions_this_month=0)
-        db.session.add(guest)
-        db.session.commit()
-    
-    return guest.conversions_this_month < app.config['GUEST_CREDITS_PER_MONTH']
+def check_guest_limit(ip_address, fresh=False):
+    """Check if guest has remaining conversions this month (answered from memory)"""
+    return guest_quota.can_convert(ip_address, app.config['GUEST_CREDITS_PER_MONTH'], fresh)
 
-def increment_guest_conversion(ip_address):
-    """Increment guest conversion count"""
-    month_year = datetime.now().strftime('%Y-%m')
-    guest = GuestConversion.query.filter_by(ip_address=ip_address, month_year=month_year).first()
-    
-    if guest:
-        guest.conversions_this_month += 1
-        guest.last_conversion = datetime.utcnow()
-        db.session.commit()
+def admission_buckets():
+    """Token buckets a conversion request is charged to: the client IP, plus the account when logged in"""
+    buckets = [('ip', get_client_ip())]
+    if current_user.is_authenticated:
+        buckets.append(('user', current_user.id))
+    return buckets
+
+def over_capacity(rejection):
+    """429/503 JSON response, with Retry-After, for an admission rejection"""
+    status, retry_after, message = rejection
+    response = jsonify({'success': False, 'message': message})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, status
+
+# Endpoints whose uploads are turned away by admission control when over capacity
+ADMISSION_ENDPOINTS = ('convert', 'batch_convert', 'guest_convert')
+
+@app.before_request
+def shed_load():
+    """Cheap admission pre-check, before the request body is read and parsed"""
+    if request.method == 'POST' and request.endpoint in ADMISSION_ENDPOINTS:
+        rejection = admission.check(admission_buckets())
+        if rejection:
+            return over_capacity(rejection)
+
+def submitted_by_client(conversion):
+    """Whether the conversion belongs to the logged-in user, or to this guest IP"""
+    if conversion.user_id is not None:
+        return current_user.is_authenticated and current_user.id == conversion.user_id
+    return conversion.guest_ip == get_client_ip()
+
+def job_status_payload(conversion):
+    """JSON body describing a conversion job, polled by the upload pages"""
+    payload = {
+        'success': conversion.status != 'failed',
+        'job_id': conversion.id,
+        'status': conversion.status,
+        'message': conversion.message or f"Conversion {conversion.status}",
+        'pages': conversion.pages,
+        'credits_used': conversion.credits_used,
+        'status_url': url_for('job_status', job_id=conversion.id)
+    }
+    
+    if conversion.user_id is not None:
+        payload['remaining_credits'] = conversion.user.credits
+    
+    if conversion.has_download:
+        payload['download_url'] = url_for('download', filename=conversion.converted_filename)
+    
+    return payload
 
 # Routes
 
@@ -163,10 +238,13 @@ def logout():
 def dashboard():
     check_daily_bonus(current_user)
     conversions = Conversion.query.filter_by(user_id=current_user.id).order_by(Conversion.created_at.desc()).limit(5).all()
-    return render_template('dashboard.html', user=current_user, recent_conversions=conversions)
+    conversion_count, pages_converted = current_user.conversion_stats()
+    return render_template('dashboard.html', user=current_user, recent_conversions=conversions,
+                           conversion_count=conversion_count, pages_converted=pages_converted)
 
 @app.route('/convert', methods=['POST'])
 @login_required_with_message
+@REQUEST_SECONDS.labels(endpoint='convert').time()
 def convert():
     if 'file' not in request.files:
         return jsonify({'success': False, 'message': 'No file uploaded'}), 400
@@ -179,67 +257,196 @@ def convert():
     if not allowed_file(file.filename):
         return jsonify({'success': False, 'message': 'Invalid file type. Only PDF, PNG, JPG allowed'}), 400
     
+    output_format = (request.form.get('format') or 'xlsx').lower()
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({'success': False, 'message': f"Invalid format. Choose one of: {', '.join(sorted(OUTPUT_FORMATS))}"}), 400
+    
     # Save uploaded file
     filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    unique_filename = f"{timestamp}_{filename}"
+    # The token keeps same-named uploads in the same second apart
+    stamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+    unique_filename = f"{stamp}_{filename}"
     upload_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(upload_path)
+    content_hash, error = save_upload(file, upload_path)
     
-    # Count pages
-    pages = count_pdf_pages(upload_path)
+    # Count pages from the trailer, rejecting unreadable and encrypted files
+    if not error:
+        pages, error = inspect_upload(upload_path)
     
-    if pages == 0:
+    if error:
         os.remove(upload_path)
-        return jsonify({'success': False, 'message': 'Could not read PDF file'}), 400
+        return jsonify({'success': False, 'message': error}), 400
     
-    # Check if user has enough credits
-    if current_user.credits < pages:
+    # Reserve the credits up front; the job settles or refunds them when it finishes
+    reservation = current_user.reserve_credits(pages, f"Conversion: {filename}")
+    if reservation is None:
+        db.session.rollback()
         os.remove(upload_path)
         return jsonify({'success': False, 'message': f'Not enough credits. You need {pages} credits but have {current_user.credits}'}), 400
+    db.session.flush()
+    
+    # Queue the conversion (committed together with the reservation)
+    output_filename = f"{stamp}_{filename.rsplit('.', 1)[0]}.{output_format}"
+    
+    conversion = Conversion(
+        user_id=current_user.id,
+        original_filename=filename,
+        converted_filename=output_filename,
+        upload_filename=unique_filename,
+        content_hash=content_hash,
+        pages=pages,
+        credits_used=pages,
+        status='queued',
+        output_format=output_format,
+        reservation_id=reservation.id
+    )
+    db.session.add(conversion)
+    db.session.flush()
+    
+    # Charge the rate limits by page count and take a slot, freed when the job finishes
+    rejection = admission.admit(admission_buckets(), pages, slot=conversion.admission_slot)
+    if rejection:
+        db.session.rollback()
+        os.remove(upload_path)
+        return over_capacity(rejection)
+    db.session.commit()
     
-    # Convert PDF to Excel
-    output_filename = f"{timestamp}_{filename.rsplit('.', 1)[0]}.xlsx"
-    output_path = os.path.join(app.config['CONVERTED_FOLDER'], output_filename)
+    if output_format in STREAM_FORMATS:
+        return stream_conversion(conversion)
     
-    success, pages_converted, message = convert_pdf_to_excel(upload_path, output_path)
+    # Cached results complete inline, everything else is left queued
+    conversion_queue.submit(conversion)
+    db.session.refresh(conversion)
     
-    if success:
-        # Deduct credits
-        current_user.deduct_credits(pages, f"Conversion: {filename}")
-        
-        # Save conversion record
-        conversion = Conversion(
-            user_id=current_user.id,
-            original_filename=filename,
-            converted_filename=output_filename,
-            pages=pages,
-            credits_used=pages,
-            status='completed'
-        )
-        db.session.add(conversion)
-        db.session.commit()
+    return jsonify(job_status_payload(conversion)), 200 if conversion.status == 'completed' else 202
+
+def save_batch(files, batch_path):
+    """Save a batch's statements (PDFs/images, or ZIPs of them) into batch_path
+    
+    Returns ([(original name, saved name, pages)], error); the first bad
+    file rejects the whole batch.
+    """
+    saved = []
+    max_files = app.config['BATCH_MAX_FILES']
+    
+    for file in files:
+        filename = secure_filename(file.filename)
         
-        # Clean up uploaded file
-        os.remove(upload_path)
+        if filename.lower().endswith('.zip'):
+            zip_path = os.path.join(batch_path, f"upload_{len(saved)}.zip")
+            content_hash, error = save_upload(file, zip_path)
+            if not error:
+                names, error = extract_zip_statements(
+                    zip_path, batch_path, app.config['ALLOWED_EXTENSIONS'],
+                    max_files - len(saved), app.config['MAX_CONTENT_LENGTH'], first_position=len(saved) + 1)
+                saved.extend((name.split('_', 1)[1], name) for name in names)
+            os.remove(zip_path)
+            if error:
+                return None, f"{filename}: {error}"
+            continue
         
-        return jsonify({
-            'success': True,
-            'message': message,
-            'pages': pages,
-            'credits_used': pages,
-            'remaining_credits': current_user.credits,
-            'download_url': url_for('download', filename=output_filename)
-        })
-    else:
-        # Clean up files
-        os.remove(upload_path)
-        if os.path.exists(output_path):
-            os.remove(output_path)
+        if not allowed_file(filename):
+            return None, f"{filename}: Invalid file type. Only PDF, PNG, JPG or ZIP allowed"
+        if len(saved) >= max_files:
+            return None, f"A batch can contain at most {max_files} statements"
         
-        return jsonify({'success': False, 'message': message}), 500
+        saved_name = batch_file_name(len(saved) + 1, filename)
+        content_hash, error = save_upload(file, os.path.join(batch_path, saved_name))
+        if error:
+            return None, f"{filename}: {error}"
+        saved.append((filename, saved_name))
+    
+    statements = []
+    for filename, saved_name in saved:
+        pages, error = inspect_upload(os.path.join(batch_path, saved_name))
+        if error:
+            return None, f"{filename}: {error}"
+        statements.append((filename, saved_name, pages))
+    
+    return statements, None
+
+@app.route('/batch-convert', methods=['POST'])
+@login_required_with_message
+@REQUEST_SECONDS.labels(endpoint='batch_convert').time()
+def batch_convert():
+    """Convert several statements (files[] and/or ZIPs) into one workbook or a ZIP of workbooks"""
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        return jsonify({'success': False, 'message': 'No files uploaded'}), 400
+    
+    output_format = (request.form.get('format') or 'xlsx').lower()
+    if output_format not in ('xlsx', 'zip'):
+        return jsonify({'success': False, 'message': 'Invalid format. Choose one of: xlsx, zip'}), 400
+    
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    batch_folder = f"batch_{timestamp}_{secrets.token_hex(4)}"
+    batch_path = os.path.join(app.config['UPLOAD_FOLDER'], batch_folder)
+    os.makedirs(batch_path)
+    
+    statements, error = save_batch(files, batch_path)
+    if error:
+        shutil.rmtree(batch_path, ignore_errors=True)
+        return jsonify({'success': False, 'message': error}), 400
+    
+    pages = sum(statement_pages for filename, saved_name, statement_pages in statements)
+    
+    # The whole batch is reserved in one statement: all of it or nothing
+    description = f"Batch conversion: {len(statements)} statement(s)"
+    reservation = current_user.reserve_credits(pages, description)
+    if reservation is None:
+        db.session.rollback()
+        shutil.rmtree(batch_path, ignore_errors=True)
+        return jsonify({'success': False, 'message': f'Not enough credits. You need {pages} credits but have {current_user.credits}'}), 400
+    db.session.flush()
+    
+    conversion = Conversion(
+        user_id=current_user.id,
+        original_filename=f"{len(statements)} statements" if len(statements) > 1 else statements[0][0],
+        converted_filename=f"{batch_folder}.{output_format}",
+        upload_filename=batch_folder,
+        pages=pages,
+        credits_used=pages,
+        status='queued',
+        output_format=output_format,
+        reservation_id=reservation.id,
+        is_batch=True
+    )
+    db.session.add(conversion)
+    db.session.flush()
+    
+    rejection = admission.admit(admission_buckets(), pages, slot=conversion.admission_slot)
+    if rejection:
+        db.session.rollback()
+        shutil.rmtree(batch_path, ignore_errors=True)
+        return over_capacity(rejection)
+    db.session.commit()
+    
+    conversion_queue.submit(conversion)
+    db.session.refresh(conversion)
+    
+    return jsonify(job_status_payload(conversion)), 202
+
+def stream_conversion(conversion):
+    """Send CSV/NDJSON rows as pages are extracted instead of queueing a file"""
+    chunks = conversion_queue.stream(conversion)
+    
+    # Pull up to the first page with data so an empty or unreadable
+    # statement still gets a JSON error instead of an empty 200
+    first_chunk = next(chunks, None)
+    if first_chunk is None:
+        db.session.refresh(conversion)
+        return jsonify(job_status_payload(conversion)), 422
+    
+    response = Response(
+        stream_with_context(itertools.chain([first_chunk], chunks)),
+        mimetype=STREAM_FORMATS[conversion.output_format]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{conversion.converted_filename}"'
+    response.headers['X-Job-Id'] = str(conversion.id)
+    return response
 
 @app.route('/guest-convert', methods=['GET', 'POST'])
+@REQUEST_SECONDS.labels(endpoint='guest_convert').time()
 def guest_convert():
     if current_user.is_authenticated:
         return redirect(url_for('dashboard'))
@@ -252,7 +459,8 @@ def guest_convert():
     # POST request - handle conversion
     ip_address = get_client_ip()
     
-    if not check_guest_limit(ip_address):
+    # Cheap early answer; the upload is held to the limit by guest_quota.reserve() below
+    if not check_guest_limit(ip_address, fresh=True):
         return jsonify({'success': False, 'message': 'Monthly guest limit reached. Please sign up for more conversions.'}), 403
     
     if 'file' not in request.files:
@@ -268,69 +476,102 @@ def guest_convert():
     
     # Save uploaded file
     filename = secure_filename(file.filename)
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    unique_filename = f"guest_{timestamp}_{filename}"
+    stamp = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{secrets.token_hex(4)}"
+    unique_filename = f"guest_{stamp}_{filename}"
     upload_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(upload_path)
+    content_hash, error = save_upload(file, upload_path)
     
     # Count pages (guest limit: 1 page only)
-    pages = count_pdf_pages(upload_path)
+    if not error:
+        pages, error = inspect_upload(upload_path)
     
-    if pages == 0:
+    if error:
         os.remove(upload_path)
-        return jsonify({'success': False, 'message': 'Could not read PDF file'}), 400
+        return jsonify({'success': False, 'message': error}), 400
     
     if pages > 1:
         os.remove(upload_path)
         return jsonify({'success': False, 'message': 'Guest users can only convert 1-page PDFs. Please sign up for more.'}), 400
     
-    # Convert PDF to Excel
-    output_filename = f"guest_{timestamp}_{filename.rsplit('.', 1)[0]}.xlsx"
-    output_path = os.path.join(app.config['CONVERTED_FOLDER'], output_filename)
-    
-    success, pages_converted, message = convert_pdf_to_excel(upload_path, output_path)
-    
-    if success:
-        # Increment guest conversion count
-        increment_guest_conversion(ip_address)
-        
-        # Save conversion record
-        conversion = Conversion(
-            original_filename=filename,
-            converted_filename=output_filename,
-            pages=pages,
-            credits_used=0,
-            status='completed',
-            guest_ip=ip_address
-        )
-        db.session.add(conversion)
-        db.session.commit()
-        
-        # Clean up uploaded file
+    # Count it against the monthly limit now, so queued and running uploads count too;
+    # a failed job gives it back
+    if not guest_quota.reserve(ip_address, app.config['GUEST_CREDITS_PER_MONTH']):
+        db.session.rollback()
         os.remove(upload_path)
-        
-        return jsonify({
-            'success': True,
-            'message': message,
-            'download_url': url_for('download', filename=output_filename)
-        })
-    else:
-        # Clean up files
+        return jsonify({'success': False, 'message': 'Monthly guest limit reached. Please sign up for more conversions.'}), 403
+    
+    # Queue the conversion (committed together with the quota)
+    output_filename = f"guest_{stamp}_{filename.rsplit('.', 1)[0]}.xlsx"
+    
+    conversion = Conversion(
+        original_filename=filename,
+        converted_filename=output_filename,
+        upload_filename=unique_filename,
+        content_hash=content_hash,
+        pages=pages,
+        credits_used=0,
+        status='queued',
+        guest_ip=ip_address
+    )
+    db.session.add(conversion)
+    db.session.flush()
+    
+    rejection = admission.admit(admission_buckets(), pages, slot=conversion.admission_slot)
+    if rejection:
+        db.session.rollback()
         os.remove(upload_path)
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        
-        return jsonify({'success': False, 'message': message}), 500
+        return over_capacity(rejection)
+    db.session.commit()
+    
+    # Cached results complete inline, everything else is left queued
+    conversion_queue.submit(conversion)
+    db.session.refresh(conversion)
+    
+    return jsonify(job_status_payload(conversion)), 200 if conversion.status == 'completed' else 202
+
+@app.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    conversion = db.session.get(Conversion, job_id)
+    
+    # Jobs are only visible to the user (or guest IP) that submitted them
+    if conversion is None or not submitted_by_client(conversion):
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    return jsonify(job_status_payload(conversion))
 
 @app.route('/download/<filename>')
 def download(filename):
+    filename = secure_filename(filename)
     file_path = os.path.join(app.config['CONVERTED_FOLDER'], filename)
     
-    if not os.path.exists(file_path):
-        flash('File not found', 'danger')
+    # Batch outputs are only served to whoever submitted the batch
+    batch = Conversion.query.filter_by(converted_filename=filename, is_batch=True).first() if filename else None
+    if batch is not None and not submitted_by_client(batch):
+        file_path = None
+    
+    if not filename or not file_path or not os.path.isfile(file_path):
+        expired = Conversion.query.filter_by(converted_filename=filename, status='expired').first()
+        flash('This file has expired. Please convert the statement again' if expired else 'File not found', 'danger')
         return redirect(url_for('dashboard' if current_user.is_authenticated else 'index'))
     
-    return send_file(file_path, as_attachment=True)
+    if app.config['DOWNLOAD_ACCEL_PREFIX']:
+        # nginx sends the file itself (with its own range/conditional handling)
+        response = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response.headers['X-Accel-Redirect'] = app.config['DOWNLOAD_ACCEL_PREFIX'].rstrip('/') + '/' + filename
+    else:
+        # ETag/Last-Modified for 304s and Range requests; X-Sendfile when USE_X_SENDFILE is set
+        response = send_from_directory(app.config['CONVERTED_FOLDER'], filename, as_attachment=True, conditional=True)
+    
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Statements are private; let browsers keep a copy but revalidate it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/metrics')
+def metrics():
+    data, content_type = render_metrics()
+    return Response(data, mimetype=content_type)
 
 @app.route('/pricing')
 def pricing():
@@ -339,19 +580,30 @@ def pricing():
 @app.route('/credits')
 @login_required_with_message
 def credits():
-    transactions = CreditTransaction.query.filter_by(user_id=current_user.id).order_by(CreditTransaction.created_at.desc()).all()
-    return render_template('credits.html', user=current_user, transactions=transactions)
+    cursor = request.args.get('before')
+    transactions, next_cursor = keyset_page(
+        CreditTransaction.query.filter_by(user_id=current_user.id), CreditTransaction, cursor)
+    credits_earned, credits_used = current_user.credit_totals()
+    return render_template('credits.html', user=current_user, transactions=transactions,
+                           credits_earned=credits_earned, credits_used=credits_used,
+                           cursor=cursor, next_cursor=next_cursor)
 
 @app.route('/history')
 @login_required_with_message
 def history():
-    conversions = Conversion.query.filter_by(user_id=current_user.id).order_by(Conversion.created_at.desc()).all()
-    return render_template('history.html', conversions=conversions)
+    cursor = request.args.get('before')
+    conversions, next_cursor = keyset_page(
+        Conversion.query.filter_by(user_id=current_user.id), Conversion, cursor)
+    conversion_count, pages_converted = current_user.conversion_stats()
+    return render_template('history.html', conversions=conversions, conversion_count=conversion_count,
+                           cursor=cursor, next_cursor=next_cursor)
 
 @app.route('/profile')
 @login_required_with_message
 def profile():
-    return render_template('profile.html', user=current_user)
+    conversion_count, pages_converted = current_user.conversion_stats()
+    return render_template('profile.html', user=current_user,
+                           conversion_count=conversion_count, pages_converted=pages_converted)
 
 @app.route('/contact')
 def contact():
@@ -370,8 +622,13 @@ def privacy():
 def terms():
     return render_template('terms.html')
 
-with app.app_context():
-    db.create_all()
+# Sandbox workers re-import this file as __mp_main__ when it is run directly
+if __name__ != '__mp_main__':
+    with app.app_context():
+        db.create_all()
+        conversion_queue.resume_pending()
+        conversion_queue.start()
+        retention_sweeper.start()
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,209 @@
+"""Extractor and writer micro-benchmarks
+
+Generates synthetic SBI (ruled table) and PhonePe (text layout)
+statements, times each pipeline stage and reports pages/sec, rows/sec
+and peak RSS. Every stage runs in a fresh process so its peak RSS is
+not inflated by the stages before it.
+
+    python -m benchmarks.run --pages 20 --rows 30
+    python -m benchmarks.run --save-baseline          # write benchmarks/baseline.json
+    python -m benchmarks.run --compare                # fail if >10% slower than the baseline (record one first)
+    python -m benchmarks.run --pages 400 --rounds 1 --stage 'convert_pdf_to_excel[sbi]' --max-rss-mb 256
+
+Sequential extraction releases each page once it is extracted, so the
+peak RSS of a conversion should not grow with page count; the last
+command checks that bound on a 400-page statement.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import generate_sbi_pdf, generate_phonepe_pdf
+from utils.pdf_converter import (PDFDocument, extract_sbi_format, extract_phonepe_format,
+                                 extract_generic_table, extract_data_from_pdf, create_excel_from_tables,
+                                 convert_pdf_to_excel)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+def _run_extractor(extractor, pdf_path, text_engine='fast'):
+    rows = 0
+    with PDFDocument(pdf_path, text_engine) as document:
+        for page in document.pages:
+            table = extractor(page)
+            if table:
+                rows += len(table)
+        return document.page_count, rows
+
+def _stage_sbi(workdir, sbi_path, phonepe_path):
+    return _run_extractor(extract_sbi_format, sbi_path)
+
+def _stage_generic(workdir, sbi_path, phonepe_path):
+    return _run_extractor(extract_generic_table, sbi_path)
+
+def _stage_phonepe(workdir, sbi_path, phonepe_path):
+    return _run_extractor(extract_phonepe_format, phonepe_path)
+
+def _stage_phonepe_pdfplumber_text(workdir, sbi_path, phonepe_path):
+    return _run_extractor(extract_phonepe_format, phonepe_path, 'pdfplumber')
+
+def _stage_extract_sbi(workdir, sbi_path, phonepe_path):
+    with PDFDocument(sbi_path) as document:
+        tables = extract_data_from_pdf(sbi_path, document)
+        return document.page_count, sum(len(table['data']) for table in tables)
+
+def _page_cache_options(sbi_path):
+    return {'folder': os.path.join(os.path.dirname(sbi_path), 'page_cache'), 'max_bytes': 1024 ** 3}
+
+def _prepare_page_cache(sbi_path):
+    extract_data_from_pdf(sbi_path, page_cache=_page_cache_options(sbi_path))
+
+def _stage_extract_sbi_page_cache(workdir, sbi_path, phonepe_path):
+    # Every page was extracted once by _prepare_page_cache
+    with PDFDocument(sbi_path, page_cache=_page_cache_options(sbi_path)) as document:
+        tables = extract_data_from_pdf(sbi_path, document)
+        return document.page_count, sum(len(table['data']) for table in tables)
+
+# Tables extracted by _prepare_tables, outside the timed region
+_prepared_tables = None
+
+def _prepare_tables(sbi_path):
+    global _prepared_tables
+    _prepared_tables = extract_data_from_pdf(sbi_path)
+
+def _prepared_rows():
+    return sum(len(table['data']) for table in _prepared_tables)
+
+def _stage_excel(workdir, sbi_path, phonepe_path):
+    create_excel_from_tables(_prepared_tables, os.path.join(workdir, 'excel.xlsx'))
+    return len(_prepared_tables), _prepared_rows()
+
+def _stage_convert_sbi(workdir, sbi_path, phonepe_path):
+    success, pages, message = convert_pdf_to_excel(sbi_path, os.path.join(workdir, 'sbi.xlsx'))
+    return pages, _prepared_rows()
+
+STAGES = {
+    'extract_sbi_format': (_stage_sbi, None),
+    'extract_generic_table': (_stage_generic, None),
+    'extract_phonepe_format': (_stage_phonepe, None),
+    'extract_phonepe_format[pdfplumber text]': (_stage_phonepe_pdfplumber_text, None),
+    'extract_data_from_pdf[sbi]': (_stage_extract_sbi, None),
+    'extract_data_from_pdf[sbi, cached pages]': (_stage_extract_sbi_page_cache, _prepare_page_cache),
+    'create_excel_from_tables': (_stage_excel, _prepare_tables),
+    'convert_pdf_to_excel[sbi]': (_stage_convert_sbi, _prepare_tables),
+}
+
+def _measure(name, workdir, sbi_path, phonepe_path, rounds):
+    """Runs inside a fresh child process"""
+    stage, prepare = STAGES[name]
+    if prepare:
+        prepare(sbi_path)
+    
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        pages, rows = stage(workdir, sbi_path, phonepe_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    
+    # Peak for the whole child, including any preparation step.
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+    
+    return {
+        'seconds': round(best, 4),
+        'pages_per_sec': round(pages / best, 2) if best else 0.0,
+        'rows_per_sec': round(rows / best, 2) if best else 0.0,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+    }
+
+def run(pages, rows, rounds, stages=None):
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        sbi_path = os.path.join(workdir, 'sbi.pdf')
+        phonepe_path = os.path.join(workdir, 'phonepe.pdf')
+        generate_sbi_pdf(sbi_path, pages, rows)
+        generate_phonepe_pdf(phonepe_path, pages, rows)
+        
+        for name in stages or STAGES:
+            with context.Pool(1) as pool:
+                results[name] = pool.apply(_measure, (name, workdir, sbi_path, phonepe_path, rounds))
+            print(_format_row(name, results[name]), flush=True)
+    
+    return results
+
+def _format_row(name, result):
+    return (f"{name:<42} {result['seconds']:>8.3f}s {result['pages_per_sec']:>9.1f} pages/s "
+            f"{result['rows_per_sec']:>10.1f} rows/s {result['peak_rss_mb']:>7.1f} MB")
+
+def compare(results, baseline, threshold):
+    """Print per-stage deltas; returns the stages that regressed beyond threshold"""
+    regressions = []
+    print(f"\nvs baseline (threshold {threshold:.0%}):")
+    
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"  {name:<42} no baseline")
+            continue
+        before = baseline[name]
+        speed = result['rows_per_sec'] / before['rows_per_sec'] - 1 if before['rows_per_sec'] else 0.0
+        memory = result['peak_rss_mb'] / before['peak_rss_mb'] - 1 if before['peak_rss_mb'] else 0.0
+        regressed = speed < -threshold or memory > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<42} rows/s {speed:+.1%}  peak RSS {memory:+.1%}{'  REGRESSION' if regressed else ''}")
+    
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20, help='pages per synthetic statement')
+    parser.add_argument('--rows', type=int, default=30, help='transactions per page (capped by layout)')
+    parser.add_argument('--rounds', type=int, default=3, help='timed rounds per stage; the best is kept')
+    parser.add_argument('--stage', action='append', choices=list(STAGES), help='run only these stages')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed slowdown/RSS growth')
+    parser.add_argument('--max-rss-mb', type=float, help='fail if any stage peaks above this RSS')
+    args = parser.parse_args(argv)
+    
+    # Checked before the stages run, which takes a while
+    has_baseline = os.path.exists(args.baseline)
+    if args.compare and not has_baseline and not args.save_baseline:
+        print(f"No baseline at {args.baseline}; record one on this machine with --save-baseline first")
+        return 1
+    
+    results = run(args.pages, args.rows, args.rounds, args.stage)
+    params = {'pages': args.pages, 'rows': args.rows}
+    
+    if args.max_rss_mb is not None:
+        over = [name for name, result in results.items() if result['peak_rss_mb'] > args.max_rss_mb]
+        for name in over:
+            print(f"{name} peaked at {results[name]['peak_rss_mb']} MB, above {args.max_rss_mb} MB")
+        if over:
+            return 1
+    
+    if args.compare and has_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print(f"warning: baseline was recorded with {baseline.get('params')}, this run used {params}")
+        if compare(results, baseline.get('stages', {}), args.threshold):
+            return 1
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params, 'stages': results}, f, indent=2)
+        print(f"\nbaseline written to {args.baseline}")
+    
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
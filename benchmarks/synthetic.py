@@ -0,0 +1,137 @@
+"""Synthetic bank statement PDFs for benchmarking
+
+Writes minimal PDFs by hand (built-in Helvetica, no embedded fonts) so
+statements of any size can be generated offline without extra packages.
+"""
+import random
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+
+SBI_HEADER = ['Txn Date', 'Value Date', 'Description', 'Ref No./Cheque No.', 'Debit', 'Credit', 'Balance']
+SBI_COLUMN_WIDTHS = [55, 55, 170, 85, 55, 55, 60]
+SBI_ROW_HEIGHT = 14
+SBI_MAX_ROWS = 52
+
+PHONEPE_LINE_HEIGHT = 11
+PHONEPE_MAX_ROWS = 11
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+PAYEES = ['SWIGGY', 'ZOMATO', 'AMAZON PAY', 'IRCTC', 'BIG BAZAAR', 'JIO RECHARGE', 'ELECTRICITY BOARD', 'RENT']
+
+def _escape(text):
+    # Byte 0x80 is mapped to the rupee glyph by the font's /Differences
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)').replace('₹', '\x80')
+
+def _text(x, y, text, size=7):
+    return f"BT /F1 {size} Tf {x:.2f} {y:.2f} Td ({_escape(text)}) Tj ET"
+
+def _amount(rng):
+    return f"{rng.randint(10, 99999):,}.{rng.randint(0, 99):02d}"
+
+def _sbi_page(rng, page_num, rows):
+    ops = [_text(30, PAGE_HEIGHT - 40, 'STATE BANK OF INDIA - Account Statement', 12),
+           _text(30, PAGE_HEIGHT - 56, f'Account No: 00000012345678   Page {page_num}', 8)]
+    
+    top = PAGE_HEIGHT - 80
+    left = 30
+    right = left + sum(SBI_COLUMN_WIDTHS)
+    bottom = top - SBI_ROW_HEIGHT * (rows + 1)
+    
+    # Ruling lines, so pdfplumber's default lattice strategy finds the table
+    ops.append('0.5 w')
+    for row in range(rows + 2):
+        y = top - row * SBI_ROW_HEIGHT
+        ops.append(f"{left} {y} m {right} {y} l S")
+    x = left
+    for width in SBI_COLUMN_WIDTHS + [0]:
+        ops.append(f"{x} {top} m {x} {bottom} l S")
+        x += width
+    
+    balance = rng.randint(10000, 500000)
+    for row in range(rows + 1):
+        if row == 0:
+            cells = SBI_HEADER
+        else:
+            day = f"{rng.randint(1, 28):02d} {rng.choice(MONTHS)} 2024"
+            debit = _amount(rng) if rng.random() < 0.7 else ''
+            credit = '' if debit else _amount(rng)
+            cells = [day, day, f"UPI/{rng.randint(100000, 999999)}/{rng.choice(PAYEES)}",
+                     str(rng.randint(10 ** 9, 10 ** 10)), debit, credit, f"{balance:,}.00"]
+        
+        y = top - (row + 1) * SBI_ROW_HEIGHT + 4
+        x = left
+        for width, cell in zip(SBI_COLUMN_WIDTHS, cells):
+            ops.append(_text(x + 2, y, cell))
+            x += width
+    
+    return '\n'.join(ops)
+
+def _phonepe_page(rng, page_num, page_count, rows):
+    ops = [_text(40, PAGE_HEIGHT - 40, 'Transaction Statement for 98XXXXXX10', 12)]
+    y = PAGE_HEIGHT - 70
+    
+    for _ in range(rows):
+        debit = rng.random() < 0.7
+        lines = [
+            f"{rng.choice(MONTHS)} {rng.randint(1, 28):02d}, 2024",
+            f"{rng.randint(1, 12):02d}:{rng.randint(0, 59):02d} {rng.choice(['am', 'pm'])}",
+            f"{'Paid to' if debit else 'Received from'} {rng.choice(PAYEES)}",
+            f"Transaction ID T{rng.randint(10 ** 15, 10 ** 16)}",
+            f"UTR No. {rng.randint(10 ** 11, 10 ** 12)}",
+            f"{'DEBIT' if debit else 'CREDIT'} ₹{_amount(rng)}",
+        ]
+        for line in lines:
+            ops.append(_text(40, y, line, 8))
+            y -= PHONEPE_LINE_HEIGHT
+    
+    ops.append(_text(40, 30, f"Page {page_num} of {page_count}", 8))
+    return '\n'.join(ops)
+
+def _write_pdf(path, page_streams):
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding << /BaseEncoding /WinAnsiEncoding /Differences [128 /uni20B9] >> >>",
+    ]
+    page_refs = []
+    
+    for stream in page_streams:
+        data = stream.encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(data), data))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+                       % (PAGE_WIDTH, PAGE_HEIGHT, content_ref))
+        page_refs.append(len(objects))
+    
+    kids = ' '.join(f"{ref} 0 R" for ref in page_refs)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>".encode()
+    
+    with open(path, 'wb') as pdf:
+        pdf.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(pdf.tell())
+            pdf.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+        
+        xref = pdf.tell()
+        pdf.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            pdf.write(b"%010d 00000 n \n" % offset)
+        pdf.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+def generate_sbi_pdf(path, pages, rows_per_page=30, seed=0):
+    """SBI-style ruled transaction table on every page; returns the transaction row count"""
+    rows_per_page = min(rows_per_page, SBI_MAX_ROWS)
+    rng = random.Random(seed)
+    _write_pdf(path, [_sbi_page(rng, page_num, rows_per_page) for page_num in range(1, pages + 1)])
+    return pages * rows_per_page
+
+def generate_phonepe_pdf(path, pages, rows_per_page=10, seed=0):
+    """PhonePe-style text-layout statement; returns the transaction row count"""
+    rows_per_page = min(rows_per_page, PHONEPE_MAX_ROWS)
+    rng = random.Random(seed)
+    _write_pdf(path, [_phonepe_page(rng, page_num, pages, rows_per_page) for page_num in range(1, pages + 1)])
+    return pages * rows_per_page
@@ -0,0 +1,29 @@
+"""Pages/sec of the PhonePe text path with each text engine
+
+Usage: python -m benchmarks.text_engine statement.pdf [more.pdf ...]
+"""
+import sys
+import time
+from utils.pdf_converter import PDFDocument, extract_phonepe_format
+
+def pages_per_second(pdf_path, text_engine, rounds=3):
+    best = None
+    page_count = 0
+    for _ in range(rounds):
+        with PDFDocument(pdf_path, text_engine) as document:
+            page_count = document.page_count
+            start = time.perf_counter()
+            for page in document.pages:
+                extract_phonepe_format(page)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return page_count / best if best else 0.0
+
+def main(paths):
+    for pdf_path in paths:
+        plumber = pages_per_second(pdf_path, 'pdfplumber')
+        fast = pages_per_second(pdf_path, 'fast')
+        print(f"{pdf_path}: pdfplumber {plumber:.1f} pages/s, fast {fast:.1f} pages/s ({fast / plumber:.1f}x)")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
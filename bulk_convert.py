@@ -0,0 +1,238 @@
+"""Bulk statement conversion from the command line
+
+Converts every statement found in the given directories, files or glob
+patterns, several at a time, each in a sandboxed worker process (see
+utils.sandbox). Finished files are appended to a JSON Lines manifest in
+the output directory, so an interrupted run picks up where it stopped;
+files whose content was already converted are skipped, whatever their
+name. Output paths in the manifest are relative to the output directory,
+so a run can be resumed from any working directory.
+
+    python -m bulk_convert archive/ --output converted_archive
+    python -m bulk_convert 'archive/2024/**/*.pdf' --output out --format parquet --workers 8
+    python -m bulk_convert archive/ --output converted_archive --retry-failed
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from config import Config
+from utils.pdf_converter import convert_pdf_to_excel, FILE_WRITERS, TEXT_ENGINE
+from utils.sandbox import SandboxPool, SandboxError
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+def find_statements(inputs, extensions=Config.ALLOWED_EXTENSIONS):
+    """[(path, output name without extension)] for directories, files and glob patterns
+    
+    Files under a directory keep their path relative to it, so statements
+    with the same name in different folders do not collide.
+    """
+    found = {}
+    
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            for folder, dirs, files in os.walk(pattern):
+                dirs.sort()
+                for filename in sorted(files):
+                    path = os.path.join(folder, filename)
+                    found.setdefault(os.path.abspath(path), os.path.relpath(path, pattern))
+        else:
+            for path in sorted(glob.glob(pattern, recursive=True)):
+                if os.path.isfile(path):
+                    found.setdefault(os.path.abspath(path), os.path.basename(path))
+    
+    return [(path, os.path.splitext(name)[0]) for path, name in found.items()
+            if path.rsplit('.', 1)[-1].lower() in extensions]
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as statement:
+        for chunk in iter(lambda: statement.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path):
+    """content hash -> latest manifest record"""
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Last line of a run that was killed mid-write
+            records[record['sha256']] = record
+    return records
+
+class BulkConverter:
+    """Converts a list of statements, recording each finished one in the manifest"""
+    
+    def __init__(self, output_folder, output_format='xlsx', workers=1, text_engine=TEXT_ENGINE, ocr=None,
+                 page_cache=None, retry_failed=False, sandbox=None):
+        self.output_folder = output_folder
+        self.output_format = output_format
+        self.workers = workers
+        self.text_engine = text_engine
+        self.ocr = ocr
+        self.page_cache = page_cache
+        self.retry_failed = retry_failed
+        self.sandbox = sandbox or SandboxPool(size=workers)
+        self.manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+        self.records = load_manifest(self.manifest_path)
+        self.stopping = False
+        self._lock = threading.Lock()
+        self._claimed = {}  # content hash -> path converting it in this run
+        self._outputs = {self._output_path(record): content_hash for content_hash, record in self.records.items()}
+    
+    def _output_path(self, record):
+        return os.path.join(self.output_folder, record['output'])
+    
+    def run(self, statements):
+        """Convert statements ([(path, output name)]); returns the counts per status"""
+        os.makedirs(self.output_folder, exist_ok=True)
+        counts = {'converted': 0, 'skipped': 0, 'failed': 0}
+        pages = 0
+        start = time.perf_counter()
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, \
+                open(self.manifest_path, 'a') as manifest:
+            futures = [executor.submit(self._convert, path, name) for path, name in statements]
+            try:
+                for done, future in enumerate(as_completed(futures), start=1):
+                    result = future.result()
+                    counts[result['status']] += 1
+                    if result.get('record'):
+                        manifest.write(json.dumps(result['record']) + '\n')
+                        manifest.flush()
+                        os.fsync(manifest.fileno())
+                        pages += result['record']['pages']
+                    print(_format_result(done, len(statements), result), flush=True)
+            except KeyboardInterrupt:
+                self.stopping = True
+                executor.shutdown(wait=False, cancel_futures=True)
+                self.sandbox.shutdown()
+                raise
+        
+        elapsed = time.perf_counter() - start
+        print(f"\n{counts['converted']} converted, {counts['skipped']} skipped, {counts['failed']} failed; "
+              f"{pages} page(s) in {elapsed:.1f}s ({pages / elapsed if elapsed else 0:.1f} pages/s, "
+              f"{counts['converted'] / elapsed * 60 if elapsed else 0:.1f} files/min)")
+        return counts
+    
+    def _convert(self, path, name):
+        if self.stopping:
+            return {'path': path, 'status': 'skipped', 'message': 'Interrupted'}
+        
+        content_hash = file_sha256(path)
+        output_path = os.path.join(self.output_folder, f"{name}.{self.output_format}")
+        
+        with self._lock:
+            previous = self.records.get(content_hash)
+            if previous and previous['status'] == 'converted' and os.path.exists(self._output_path(previous)):
+                return {'path': path, 'status': 'skipped',
+                        'message': f"Already converted to {self._output_path(previous)}"}
+            if previous and previous['status'] == 'failed' and not self.retry_failed:
+                return {'path': path, 'status': 'skipped', 'message': f"Failed before: {previous['message']}"}
+            if content_hash in self._claimed:
+                return {'path': path, 'status': 'skipped', 'message': f"Same content as {self._claimed[content_hash]}"}
+            self._claimed[content_hash] = path
+            if self._outputs.setdefault(output_path, content_hash) != content_hash:
+                # Another statement with the same name; keep both
+                output_path = os.path.join(self.output_folder, f"{name}-{content_hash[:8]}.{self.output_format}")
+                self._outputs[output_path] = content_hash
+        
+        # Written under a temporary name, so an interrupted run never leaves a file that looks finished
+        partial_path = f"{output_path}.part"
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        start = time.perf_counter()
+        try:
+            success, pages, message = self.sandbox.run(
+                convert_pdf_to_excel, path, partial_path,
+                text_engine=self.text_engine,
+                ocr=self.ocr,
+                output_format=self.output_format,
+                page_cache=self.page_cache
+            )
+        except SandboxError as e:
+            success, pages, message = False, 0, str(e)
+        seconds = time.perf_counter() - start
+        
+        if self.stopping:
+            return {'path': path, 'status': 'skipped', 'message': 'Interrupted'}
+        
+        if success:
+            os.replace(partial_path, output_path)
+        elif os.path.exists(partial_path):
+            os.remove(partial_path)
+        
+        record = {
+            'path': path,
+            'sha256': content_hash,
+            'output': os.path.relpath(output_path, self.output_folder),
+            'status': 'converted' if success else 'failed',
+            'pages': pages,
+            'seconds': round(seconds, 3),
+            'message': message,
+            'finished_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        with self._lock:
+            self.records[content_hash] = record
+        return {'path': path, 'status': record['status'], 'message': message, 'record': record}
+
+def _format_result(done, total, result):
+    record = result.get('record')
+    timing = f"{record['pages']:>4}p {record['seconds']:>7.2f}s" if record else f"{'':>14}"
+    return f"[{done}/{total}] {result['status']:<9} {timing}  {result['path']}  {result['message']}"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='statement files, directories or glob patterns')
+    parser.add_argument('--output', required=True, help='folder for the converted files and the manifest')
+    parser.add_argument('--format', default='xlsx', choices=sorted(FILE_WRITERS), help='output file format')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='statements converted at once')
+    parser.add_argument('--text-engine', default=TEXT_ENGINE, choices=['fast', 'pdfplumber'])
+    parser.add_argument('--no-ocr', action='store_true', help='skip scanned pages and images instead of OCRing them')
+    parser.add_argument('--page-cache', help='folder for the per-page extraction cache (off by default)')
+    parser.add_argument('--retry-failed', action='store_true', help='convert again files that failed in an earlier run')
+    parser.add_argument('--timeout', type=int, default=Config.SANDBOX_TIMEOUT, help='seconds per statement, 0 for none')
+    parser.add_argument('--cpu-seconds', type=int, default=Config.SANDBOX_CPU_SECONDS, help='CPU seconds per statement, 0 for none')
+    parser.add_argument('--memory-mb', type=int, default=Config.SANDBOX_MEMORY_MB, help='memory per worker, 0 for none')
+    args = parser.parse_args(argv)
+    
+    statements = find_statements(args.inputs)
+    if not statements:
+        print("No statements found")
+        return 1
+    
+    converter = BulkConverter(
+        args.output,
+        output_format=args.format,
+        workers=args.workers,
+        text_engine=args.text_engine,
+        ocr=False if args.no_ocr else {'workers': 1},
+        page_cache={'folder': args.page_cache, 'max_bytes': Config.PAGE_CACHE_MAX_BYTES} if args.page_cache else None,
+        retry_failed=args.retry_failed,
+        sandbox=SandboxPool(size=args.workers, memory_mb=args.memory_mb, cpu_seconds=args.cpu_seconds,
+                            timeout=args.timeout)
+    )
+    print(f"{len(statements)} statement(s), {args.workers} worker(s); manifest {converter.manifest_path}")
+    
+    try:
+        counts = converter.run(statements)
+    except KeyboardInterrupt:
+        print("\nInterrupted; run the same command again to resume")
+        return 130
+    
+    return 1 if counts['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
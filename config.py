@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
@@ -11,6 +12,70 @@ class Config:
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
     
+    # Page extraction (1 worker = sequential)
+    EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS') or 1)
+    PARALLEL_MIN_PAGES = int(os.environ.get('PARALLEL_MIN_PAGES') or 8)
+    TEXT_ENGINE = os.environ.get('TEXT_ENGINE') or 'fast'  # 'fast' or 'pdfplumber'
+    
+    # Background conversion jobs (threads per web worker)
+    CONVERSION_WORKERS = int(os.environ.get('CONVERSION_WORKERS') or 2)
+    
+    # Batch conversion: statements per batch and processes converting them side by side
+    BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES') or 24)
+    BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS') or 2)
+    
+    # OCR for image uploads and scanned pages (Tesseract processes per conversion)
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS') or 2)
+    OCR_CACHE_FOLDER = os.path.join(CONVERTED_FOLDER, 'ocr_cache')
+    OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES') or 64 * 1024 * 1024)
+    
+    # Converted results reused for identical uploads (LRU within the budget)
+    RESULT_CACHE_FOLDER = os.path.join(CONVERTED_FOLDER, 'cache')
+    RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES') or 512 * 1024 * 1024)
+    
+    # Conversions run in warm child processes, killed past these limits (0 disables one):
+    # address space, CPU seconds and wall-clock seconds per conversion
+    SANDBOX_ENABLED = os.environ.get('SANDBOX_ENABLED', '1') == '1'
+    SANDBOX_WORKERS = int(os.environ.get('SANDBOX_WORKERS') or CONVERSION_WORKERS + 2)  # queue threads plus streams
+    SANDBOX_MEMORY_MB = int(os.environ.get('SANDBOX_MEMORY_MB') or 2048)
+    SANDBOX_CPU_SECONDS = int(os.environ.get('SANDBOX_CPU_SECONDS') or 300)
+    SANDBOX_TIMEOUT = int(os.environ.get('SANDBOX_TIMEOUT') or 600)
+    SANDBOX_MAX_TASKS = int(os.environ.get('SANDBOX_MAX_TASKS') or 100)  # conversions per worker before it is replaced
+    
+    # Running jobs whose web worker has exited are picked up again, as is (in case the pid
+    # was reused) any job still running this long after it started; well past the sandbox deadline
+    JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS') or 2 * (SANDBOX_TIMEOUT or 600))
+    JOB_REAP_INTERVAL = int(os.environ.get('JOB_REAP_INTERVAL') or 60)  # seconds between checks for stuck jobs, 0 disables
+    
+    # Admission control for the conversion endpoints, shared by all workers through a local
+    # SQLite file: token buckets in pages (burst, refill per minute; 0 disables) per account
+    # and per client IP, and a cap on conversions in flight (0 disables)
+    ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', '1') == '1'
+    ADMISSION_DB_PATH = (os.environ.get('ADMISSION_DB_PATH') or
+                         os.path.join(tempfile.gettempdir(), 'convertbankstatement-admission.sqlite'))
+    ADMISSION_USER_BURST = int(os.environ.get('ADMISSION_USER_BURST') or 200)
+    ADMISSION_USER_PAGES_PER_MINUTE = int(os.environ.get('ADMISSION_USER_PAGES_PER_MINUTE') or 100)
+    ADMISSION_IP_BURST = int(os.environ.get('ADMISSION_IP_BURST') or 300)
+    ADMISSION_IP_PAGES_PER_MINUTE = int(os.environ.get('ADMISSION_IP_PAGES_PER_MINUTE') or 150)
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT') or 8)
+    ADMISSION_BUSY_RETRY_AFTER = 10  # seconds, sent with 503
+    ADMISSION_SLOT_TTL = 3600  # seconds before an unreleased slot is reclaimed
+    
+    # Extracted tables of individual pages, reused when a page turns up in another upload
+    PAGE_CACHE_FOLDER = os.path.join(CONVERTED_FOLDER, 'page_cache')
+    PAGE_CACHE_MAX_BYTES = int(os.environ.get('PAGE_CACHE_MAX_BYTES') or 128 * 1024 * 1024)
+    
+    # Downloads: serve through the front-end server instead of Python when configured.
+    # DOWNLOAD_ACCEL_PREFIX is an nginx `internal` location aliased to CONVERTED_FOLDER
+    # (X-Accel-Redirect); USE_X_SENDFILE is Flask's switch for Apache/lighttpd X-Sendfile
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE') == '1'
+    
+    # Converted files are deleted after this many hours, or oldest-first over the budget
+    RETENTION_MAX_AGE_HOURS = int(os.environ.get('RETENTION_MAX_AGE_HOURS') or 72)
+    RETENTION_MAX_BYTES = int(os.environ.get('RETENTION_MAX_BYTES') or 2 * 1024 * 1024 * 1024)
+    RETENTION_SWEEP_INTERVAL = int(os.environ.get('RETENTION_SWEEP_INTERVAL') or 600)  # seconds, 0 disables
+    
     # Credit system
     GUEST_CREDITS_PER_MONTH = 1
     SIGNED_UP_CREDITS_PER_MONTH = 5
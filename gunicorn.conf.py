@@ -0,0 +1,18 @@
+import os
+import shutil
+import tempfile
+
+# Shared metrics store so /metrics reports every worker, not just the one answering
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'convertbankstatement-metrics')
+)
+
+def on_starting(server):
+    # Samples from a previous master run would otherwise be merged in
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,11 +1,22 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
+import sqlite3
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, 'connect')
+def _sqlite_wal(dbapi_connection, connection_record):
+    # WAL lets every gunicorn worker read while another one writes
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.close()
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -39,39 +50,170 @@ class User(UserMixin, db.Model):
         )
         db.session.add(transaction)
     
+    def conversion_stats(self):
+        """(conversions, pages converted), aggregated in SQL instead of loading the relationship
+        
+        Only finished conversions count; expired ones were completed before
+        their files were swept.
+        """
+        count, pages = db.session.query(
+            db.func.count(Conversion.id),
+            db.func.coalesce(db.func.sum(Conversion.pages), 0)
+        ).filter(Conversion.user_id == self.id, Conversion.status.in_(('completed', 'expired'))).one()
+        return count, pages
+    
+    def credit_totals(self):
+        """Credits earned and used over the account's lifetime, as positive numbers"""
+        totals = dict(db.session.query(
+            CreditTransaction.transaction_type,
+            db.func.coalesce(db.func.sum(db.func.abs(CreditTransaction.amount)), 0)
+        ).filter(CreditTransaction.user_id == self.id).group_by(CreditTransaction.transaction_type).all())
+        return totals.get('earned', 0), totals.get('used', 0) + totals.get('reserved', 0)
+    
     def deduct_credits(self, amount, description):
-        if self.credits >= amount:
-            self.credits -= amount
-            transaction = CreditTransaction(
-                user_id=self.id,
-                amount=-amount,
-                description=description,
-                transaction_type='used'
-            )
-            db.session.add(transaction)
-            return True
-        return False
+        return self.reserve_credits(amount, description, transaction_type='used') is not None
+    
+    def reserve_credits(self, amount, description, transaction_type='reserved'):
+        """Take credits with a single conditional UPDATE; returns the CreditTransaction, or None
+        
+        The balance check happens inside the UPDATE's WHERE clause, so
+        concurrent conversions across workers can never overdraw. The
+        reservation is settled or refunded once the conversion finishes.
+        The caller commits, together with whatever the credits pay for.
+        """
+        result = db.session.execute(
+            db.update(User)
+            .where(User.id == self.id, User.credits >= amount)
+            .values(credits=User.credits - amount)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return None
+        
+        transaction = CreditTransaction(
+            user_id=self.id,
+            amount=-amount,
+            description=description,
+            transaction_type=transaction_type
+        )
+        db.session.add(transaction)
+        db.session.expire(self, ['credits'])
+        return transaction
 
 class Conversion(db.Model):
+    __table_args__ = (
+        db.Index('ix_conversion_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     original_filename = db.Column(db.String(255), nullable=False)
     converted_filename = db.Column(db.String(255), nullable=False)
     pages = db.Column(db.Integer, nullable=False)
     credits_used = db.Column(db.Integer, nullable=False)
-    status = db.Column(db.String(20), default='completed')
+    status = db.Column(db.String(20), default='queued')  # queued, running, completed, failed, expired
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     guest_ip = db.Column(db.String(50), nullable=True)
+    upload_filename = db.Column(db.String(255), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the upload
+    message = db.Column(db.String(255), nullable=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    worker_pid = db.Column(db.Integer, nullable=True)  # web worker running the job
+    completed_at = db.Column(db.DateTime, nullable=True)
+    output_format = db.Column(db.String(10), default='xlsx')  # xlsx, parquet, csv, ndjson
+    reservation_id = db.Column(db.Integer, nullable=True)  # 'reserved' CreditTransaction until settled/refunded
+    is_batch = db.Column(db.Boolean, default=False)  # upload_filename is a folder of statements
+    
+    @property
+    def has_download(self):
+        """CSV/NDJSON results are streamed in the response and never stored"""
+        return self.status == 'completed' and self.output_format not in ('csv', 'ndjson')
+    
+    @property
+    def admission_slot(self):
+        """Name of the admission slot held from admission until the job finishes"""
+        return f"conversion:{self.id}"
 
 class CreditTransaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_credit_transaction_user_created', 'user_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     amount = db.Column(db.Integer, nullable=False)
     description = db.Column(db.String(255), nullable=False)
-    transaction_type = db.Column(db.String(20), nullable=False)
+    transaction_type = db.Column(db.String(20), nullable=False)  # earned, used, reserved, refunded
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    @staticmethod
+    def settle(transaction_id, amount=None):
+        """Turn a reservation into a charge; a no-op if it was already settled or refunded
+        
+        With amount below the reserved credits, only amount is charged and
+        the rest goes back to the user.
+        """
+        reserved = db.session.execute(
+            db.select(CreditTransaction.user_id, CreditTransaction.amount)
+            .where(CreditTransaction.id == transaction_id, CreditTransaction.transaction_type == 'reserved')
+        ).first()
+        if reserved is None:
+            return False
+        
+        charge = -reserved.amount if amount is None else min(amount, -reserved.amount)
+        result = db.session.execute(
+            db.update(CreditTransaction)
+            .where(CreditTransaction.id == transaction_id, CreditTransaction.transaction_type == 'reserved')
+            .values(transaction_type='used', amount=-charge)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return False
+        
+        if charge < -reserved.amount:
+            db.session.execute(
+                db.update(User)
+                .where(User.id == reserved.user_id)
+                .values(credits=User.credits + (-reserved.amount - charge))
+                .execution_options(synchronize_session=False)
+            )
+        return True
+    
+    @staticmethod
+    def refund(transaction_id):
+        """Mark a reservation refunded and return its credits; a no-op unless it is still reserved
+        
+        The row is kept, with its amount, as a record of the refund.
+        """
+        reserved = db.session.execute(
+            db.select(CreditTransaction.user_id, CreditTransaction.amount)
+            .where(CreditTransaction.id == transaction_id, CreditTransaction.transaction_type == 'reserved')
+        ).first()
+        if reserved is None:
+            return False
+        
+        result = db.session.execute(
+            db.update(CreditTransaction)
+            .where(CreditTransaction.id == transaction_id, CreditTransaction.transaction_type == 'reserved')
+            .values(transaction_type='refunded')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            return False
+        
+        db.session.execute(
+            db.update(User)
+            .where(User.id == reserved.user_id)
+            .values(credits=User.credits - reserved.amount)
+            .execution_options(synchronize_session=False)
+        )
+        return True
 
 class GuestConversion(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('ip_address', 'month_year', name='uq_guest_conversion_ip_month'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     ip_address = db.Column(db.String(50), nullable=False)
     conversions_this_month = db.Column(db.Integer, default=0)
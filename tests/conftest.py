@@ -0,0 +1,22 @@
+import pytest
+from flask import Flask
+from models import db, User
+
+@pytest.fixture
+def app(tmp_path):
+    # A file rather than :memory:, so every thread's connection sees the same database
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def user(app):
+    user = User(name='Test', email='test@example.com', credits=25)
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    return user
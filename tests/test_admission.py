@@ -0,0 +1,31 @@
+from flask import Flask
+from utils.admission import AdmissionControl
+
+def _admission(tmp_path, max_concurrent):
+    app = Flask(__name__)
+    app.config.update(
+        ADMISSION_ENABLED=True,
+        ADMISSION_DB_PATH=str(tmp_path / 'admission.db'),
+        ADMISSION_USER_BURST=0,
+        ADMISSION_USER_PAGES_PER_MINUTE=0,
+        ADMISSION_IP_BURST=0,
+        ADMISSION_IP_PAGES_PER_MINUTE=0,
+        ADMISSION_MAX_CONCURRENT=max_concurrent,
+        ADMISSION_BUSY_RETRY_AFTER=10,
+        ADMISSION_SLOT_TTL=3600,
+    )
+    return AdmissionControl(app)
+
+def test_each_conversion_holds_its_own_slot(tmp_path):
+    admission = _admission(tmp_path, max_concurrent=2)
+    buckets = [('ip', '10.0.0.1')]
+    
+    assert admission.admit(buckets, 1, slot='conversion:1') is None
+    assert admission.admit(buckets, 1, slot='conversion:2') is None
+    assert admission.check(buckets)[0] == 503
+    
+    # Finishing one conversion frees exactly one slot
+    admission.release('conversion:1')
+    assert admission.check(buckets) is None
+    assert admission.admit(buckets, 1, slot='conversion:3') is None
+    assert admission.check(buckets)[0] == 503
@@ -0,0 +1,70 @@
+import threading
+from models import db, User, CreditTransaction
+
+def _balance(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id).credits
+
+def test_concurrent_reservations_never_overdraw(app, user):
+    # 12 workers race for 5 credits each out of 25: exactly 5 may win
+    user_id = user.id
+    start = threading.Barrier(12)
+    results = []
+    
+    def reserve():
+        with app.app_context():
+            start.wait()
+            reservation = db.session.get(User, user_id).reserve_credits(5, 'Conversion: race.pdf')
+            db.session.commit()
+            results.append(reservation is not None)
+            db.session.remove()
+    
+    threads = [threading.Thread(target=reserve) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results.count(True) == 5
+    assert _balance(user_id) == 0
+    assert CreditTransaction.query.filter_by(user_id=user_id, transaction_type='reserved').count() == 5
+
+def test_reserve_fails_without_enough_credits(user):
+    assert user.reserve_credits(26, 'Conversion: big.pdf') is None
+    db.session.commit()
+    assert _balance(user.id) == 25
+
+def test_settle_charges_at_most_the_reservation(user):
+    reservation = user.reserve_credits(10, 'Conversion: a.pdf')
+    db.session.commit()
+    
+    assert CreditTransaction.settle(reservation.id, 4)
+    db.session.commit()
+    assert _balance(user.id) == 21
+    assert db.session.get(CreditTransaction, reservation.id).amount == -4
+    
+    # Already settled: neither a second charge nor a refund
+    assert not CreditTransaction.settle(reservation.id)
+    assert not CreditTransaction.refund(reservation.id)
+    db.session.commit()
+    assert _balance(user.id) == 21
+
+def test_refund_keeps_the_reservation_row(user):
+    reservation = user.reserve_credits(10, 'Conversion: a.pdf')
+    db.session.commit()
+    assert _balance(user.id) == 15
+    
+    assert CreditTransaction.refund(reservation.id)
+    db.session.commit()
+    assert _balance(user.id) == 25
+    
+    refunded = db.session.get(CreditTransaction, reservation.id)
+    assert refunded.transaction_type == 'refunded'
+    assert refunded.amount == -10
+    assert user.credit_totals() == (0, 0)
+    
+    # Refunded once only, and never charged afterwards
+    assert not CreditTransaction.refund(reservation.id)
+    assert not CreditTransaction.settle(reservation.id)
+    db.session.commit()
+    assert _balance(user.id) == 25
@@ -0,0 +1,44 @@
+import threading
+from datetime import datetime
+from models import db, GuestConversion
+from utils.guest_quota import GuestQuotaStore
+
+def _stored(ip_address):
+    db.session.expire_all()
+    guest = GuestConversion.query.filter_by(ip_address=ip_address).first()
+    return guest.conversions_this_month if guest else 0
+
+def test_concurrent_reservations_stay_within_the_limit(app):
+    # Each thread stands in for an upload handled by a different worker
+    stores = [GuestQuotaStore(app) for _ in range(8)]
+    start = threading.Barrier(len(stores))
+    results = []
+    
+    def reserve(store):
+        with app.app_context():
+            start.wait()
+            reserved = store.reserve('10.0.0.1', 1)
+            db.session.commit()
+            results.append(reserved)
+            db.session.remove()
+    
+    threads = [threading.Thread(target=reserve, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert results.count(True) == 1
+    assert _stored('10.0.0.1') == 1
+    assert not any(store.can_convert('10.0.0.1', 1, fresh=True) for store in stores)
+
+def test_release_gives_the_conversion_back(app):
+    store = GuestQuotaStore(app)
+    assert store.reserve('10.0.0.2', 1)
+    db.session.commit()
+    assert not store.can_convert('10.0.0.2', 1)
+    
+    store.release('10.0.0.2', datetime.utcnow())
+    db.session.commit()
+    assert store.can_convert('10.0.0.2', 1)
+    assert store.reserve('10.0.0.2', 1)
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+from models import db, Conversion, CreditTransaction
+from utils.jobs import ConversionQueue
+
+def _exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def _running(user, name, worker_pid, started_at, output_format='xlsx'):
+    reservation = user.reserve_credits(1, f"Conversion: {name}")
+    db.session.flush()
+    conversion = Conversion(user_id=user.id, original_filename=name, converted_filename=f"{name}.{output_format}",
+                            pages=1, credits_used=1, status='running', output_format=output_format,
+                            started_at=started_at, worker_pid=worker_pid, reservation_id=reservation.id)
+    db.session.add(conversion)
+    db.session.commit()
+    return conversion.id
+
+def test_reap_stuck_requeues_jobs_of_exited_workers(app, user):
+    app.config['JOB_STALE_SECONDS'] = 3600
+    queue = ConversionQueue()
+    queue.app = app
+    now = datetime.utcnow()
+    
+    alive = _running(user, 'alive', os.getpid(), now)
+    orphaned = _running(user, 'orphaned', _exited_pid(), now)
+    stale = _running(user, 'stale', os.getpid(), now - timedelta(hours=2))
+    streamed = _running(user, 'streamed', _exited_pid(), now, output_format='csv')
+    
+    requeued = queue.reap_stuck()
+    
+    assert sorted(conversion.id for conversion in requeued) == sorted([orphaned, stale])
+    statuses = {conversion.id: conversion.status for conversion in Conversion.query.all()}
+    assert statuses == {alive: 'running', orphaned: 'queued', stale: 'queued', streamed: 'failed'}
+    
+    # The streamed job's response is gone, so its credits go back
+    reservation_id = db.session.get(Conversion, streamed).reservation_id
+    assert db.session.get(CreditTransaction, reservation_id).transaction_type == 'refunded'
+    assert queue.reap_stuck() == []
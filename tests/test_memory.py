@@ -0,0 +1,34 @@
+import multiprocessing
+import resource
+import sys
+import pytest
+from benchmarks.synthetic import generate_sbi_pdf
+
+# Peak RSS a 320-page conversion may add over a 20-page one. Pages are
+# released as they are written, so the long statement should cost
+# little more than the short one.
+MAX_GROWTH_MB = 32
+
+def _peak_rss_mb(pdf_path, output_path, output_format):
+    """Runs in a fresh process, so the peak belongs to this conversion alone"""
+    from utils.pdf_converter import convert_pdf_to_excel
+    success, pages, message = convert_pdf_to_excel(pdf_path, output_path, output_format=output_format)
+    assert success, message
+    
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+def _measure(tmp_path, pages, output_format):
+    pdf_path = tmp_path / f"statement_{pages}.pdf"
+    if not pdf_path.exists():
+        generate_sbi_pdf(str(pdf_path), pages, 30)
+    
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(_peak_rss_mb, (str(pdf_path), str(tmp_path / f"out.{output_format}"), output_format))
+
+@pytest.mark.parametrize('output_format', ['xlsx', 'parquet'])
+def test_long_statement_memory_is_bounded(tmp_path, output_format):
+    short = _measure(tmp_path, 20, output_format)
+    long = _measure(tmp_path, 320, output_format)
+    assert long - short < MAX_GROWTH_MB, f"320 pages peaked at {long:.0f} MB, 20 pages at {short:.0f} MB"
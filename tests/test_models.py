@@ -0,0 +1,10 @@
+from models import db, Conversion
+
+def test_conversion_stats_count_only_finished_conversions(user):
+    for status, pages in [('completed', 3), ('expired', 2), ('queued', 5), ('running', 7), ('failed', 11)]:
+        db.session.add(Conversion(user_id=user.id, original_filename=f"{status}.pdf",
+                                  converted_filename=f"{status}.xlsx", pages=pages, credits_used=pages,
+                                  status=status))
+    db.session.commit()
+    
+    assert user.conversion_stats() == (2, 5)
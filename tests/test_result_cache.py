@@ -0,0 +1,43 @@
+import os
+from utils.metrics import RESULT_CACHE_LOOKUPS
+from utils.result_cache import ResultCache
+
+def _folder_bytes(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder))
+
+def test_formats_sharing_a_folder_share_its_budget(tmp_path):
+    folder = tmp_path / 'cache'
+    caches = [ResultCache(str(folder), 1000, 'v1', suffix=suffix) for suffix in ('.xlsx', '.parquet')]
+    
+    for index in range(10):
+        for cache in caches:
+            cache.write(f"{index:064x}", b'x' * 100)
+    
+    assert _folder_bytes(folder) <= 1000
+
+def test_get_counts_hits_and_misses(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), 1000, 'v1')
+    cache.write('a' * 64, b'workbook')
+    hits = RESULT_CACHE_LOOKUPS.labels(result='hit')._value.get()
+    misses = RESULT_CACHE_LOOKUPS.labels(result='miss')._value.get()
+    
+    assert cache.get('a' * 64, str(tmp_path / 'hit.xlsx'))
+    assert not cache.get('b' * 64, str(tmp_path / 'miss.xlsx'))
+    
+    assert RESULT_CACHE_LOOKUPS.labels(result='hit')._value.get() == hits + 1
+    assert RESULT_CACHE_LOOKUPS.labels(result='miss')._value.get() == misses + 1
+
+def test_a_hit_on_the_output_it_was_stored_from(tmp_path):
+    # The same statement uploaded again under the same output name
+    cache = ResultCache(str(tmp_path / 'cache'), 1000, 'v1')
+    output_path = tmp_path / 'statement.xlsx'
+    output_path.write_bytes(b'workbook')
+    cache.put('a' * 64, str(output_path))
+    
+    assert cache.get('a' * 64, str(output_path))
+    assert output_path.read_bytes() == b'workbook'
+    
+    # Rewriting the output in place leaves the cached entry alone
+    with open(output_path, 'r+b') as output:
+        output.write(b'WORK')
+    assert cache.read('a' * 64) == b'workbook'
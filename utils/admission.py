@@ -0,0 +1,184 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from utils.metrics import ADMISSION_REJECTIONS
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS slot (name TEXT PRIMARY KEY, pid INTEGER NOT NULL, expires REAL NOT NULL)',
+)
+
+# Admissions per process between sweeps of buckets that have refilled completely
+PURGE_EVERY = 200
+
+class AdmissionControl:
+    """Load shedding for the conversion endpoints
+    
+    Two checks, shared by every gunicorn worker through a small local
+    SQLite file (independent of the main database):
+    
+    - Token buckets per account and per client IP, measured in pages: a
+      bucket holds up to burst pages and refills at pages_per_minute, and
+      a conversion costs its page count (capped at the burst, so a large
+      file waits for a full bucket rather than forever). An empty bucket
+      answers 429. A burst or rate of 0 turns that kind of bucket off.
+    - A cap on conversions in flight, from admission until the job
+      finishes. A full house answers 503.
+    
+    Both come with a Retry-After. Slots are leased for slot_ttl seconds
+    and dropped early when the worker holding them has exited, so a
+    crashed worker cannot keep capacity forever. If the store itself
+    fails, requests are let through rather than refused.
+    """
+    
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self._local = threading.local()
+        self._admitted = 0
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['ADMISSION_ENABLED']
+        self.path = app.config['ADMISSION_DB_PATH']
+        self.limits = {
+            'user': (app.config['ADMISSION_USER_BURST'], app.config['ADMISSION_USER_PAGES_PER_MINUTE'] / 60),
+            'ip': (app.config['ADMISSION_IP_BURST'], app.config['ADMISSION_IP_PAGES_PER_MINUTE'] / 60),
+        }
+        self.max_concurrent = app.config['ADMISSION_MAX_CONCURRENT']
+        self.busy_retry_after = app.config['ADMISSION_BUSY_RETRY_AFTER']
+        self.slot_ttl = app.config['ADMISSION_SLOT_TTL']
+    
+    def _connection(self):
+        # One connection per thread and process; sqlite3 connections are neither
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+    
+    def check(self, buckets):
+        """Cheap pre-check before the request body is read; None, or (status, retry_after, message)
+        
+        buckets is [(kind, identity)] such as [('user', 7), ('ip', '10.0.0.1')].
+        Nothing is taken: the buckets only need a page left and a slot
+        must be free.
+        """
+        return self._admit(buckets, 1, None)
+    
+    def admit(self, buckets, pages, slot):
+        """Take pages from every bucket and a slot named slot, or none of them
+        
+        slot must be unique to the conversion, such as its id. Returns
+        None when admitted, else (status, retry_after, message).
+        """
+        return self._admit(buckets, max(1, pages), slot)
+    
+    def _admit(self, buckets, cost, slot):
+        if not self.enabled:
+            return None
+        
+        try:
+            connection = self._connection()
+            now = time.time()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                rejection = self._check_slots(connection, now)
+                if rejection is None:
+                    rejection = self._take_tokens(connection, buckets, cost, now, consume=slot is not None)
+                if rejection is None and slot is not None:
+                    connection.execute('INSERT INTO slot VALUES (?, ?, ?)',
+                                       (slot, os.getpid(), now + self.slot_ttl))
+                connection.execute('COMMIT')
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            print(f"Admission control error: {str(e)}")
+            return None
+        
+        if rejection is not None:
+            ADMISSION_REJECTIONS.labels(reason='busy' if rejection[0] == 503 else 'rate_limited').inc()
+        elif slot is not None:
+            self._admitted += 1
+            if self._admitted % PURGE_EVERY == 0:
+                self._purge()
+        return rejection
+    
+    def _check_slots(self, connection, now):
+        if not self.max_concurrent:
+            return None
+        
+        # Expired leases, and slots of workers that have since exited
+        connection.execute('DELETE FROM slot WHERE expires < ?', (now,))
+        held = connection.execute('SELECT name, pid FROM slot').fetchall()
+        dead = [(name,) for name, pid in held if not pid_alive(pid)]
+        connection.executemany('DELETE FROM slot WHERE name = ?', dead)
+        
+        if len(held) - len(dead) >= self.max_concurrent:
+            return 503, self.busy_retry_after, 'The converter is busy right now. Please try again shortly.'
+        return None
+    
+    def _take_tokens(self, connection, buckets, cost, now, consume):
+        wait = 0
+        balances = []
+        
+        for kind, identity in buckets:
+            burst, rate = self.limits[kind]
+            if not burst or not rate:
+                continue
+            key = f"{kind}:{identity}"
+            row = connection.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + (now - row[1]) * rate)
+            needed = min(cost, burst)
+            if tokens < needed:
+                wait = max(wait, (needed - tokens) / rate)
+            balances.append((key, tokens - needed))
+        
+        if wait:
+            return 429, math.ceil(wait), 'Too many conversions. Please wait before converting more pages.'
+        
+        if consume:
+            connection.executemany('INSERT OR REPLACE INTO bucket VALUES (?, ?, ?)',
+                                   [(key, tokens, now) for key, tokens in balances])
+        return None
+    
+    def release(self, slot):
+        """Free a slot taken by admit(); called when its conversion finishes"""
+        if not self.enabled or not slot:
+            return
+        
+        try:
+            self._connection().execute('DELETE FROM slot WHERE name = ?', (slot,))
+        except Exception as e:
+            print(f"Admission control error: {str(e)}")
+    
+    def _purge(self):
+        # A bucket idle for burst / rate seconds is full again, the same as no row
+        try:
+            now = time.time()
+            connection = self._connection()
+            for kind, (burst, rate) in self.limits.items():
+                if not burst or not rate:
+                    continue
+                connection.execute('DELETE FROM bucket WHERE key LIKE ? AND updated < ?',
+                                   (f"{kind}:%", now - burst / rate))
+        except Exception as e:
+            print(f"Admission control error: {str(e)}")
+
+def pid_alive(pid):
+    """Whether a process with this pid still exists on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
@@ -0,0 +1,210 @@
+import csv
+import io
+import json
+import os
+from datetime import date
+from decimal import Decimal
+from utils.transactions import DATE, AMOUNT, TEXT, MISSING_DATE, MISSING_AMOUNT
+
+# date32 counts days from 1970-01-01
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Parquet amount column: (precision, scale) of the decimal, i.e. rupees and paise
+AMOUNT_DECIMAL = (18, 2)
+
+# Formats streamed straight into the HTTP response (no file is kept)
+STREAM_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Formats written to CONVERTED_FOLDER by the job queue and downloaded later
+FILE_FORMATS = {'xlsx', 'parquet'}
+
+OUTPUT_FORMATS = FILE_FORMATS | set(STREAM_FORMATS)
+
+def table_columns(header):
+    """Column names from a table's header, made unique and non-blank"""
+    columns = []
+    for col_idx, name in enumerate(header):
+        name = ' '.join(str(name or '').split()) or f"Column {col_idx + 1}"
+        candidate, suffix = name, 2
+        while candidate in columns:
+            candidate = f"{name} {suffix}"
+            suffix += 1
+        columns.append(candidate)
+    
+    return columns
+
+def iter_csv(tables):
+    """CSV text chunks, one per page
+    
+    Each page's header is written only when it differs from the previous
+    one, so a multi-page statement reads as a single table. Dates are
+    written as YYYY-MM-DD and amounts as plain 1234.50.
+    """
+    last_header = None
+    
+    for table_info in tables:
+        table = table_info['data']
+        if not table:
+            continue
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        if table.header != last_header:
+            writer.writerow(table.header)
+            last_header = table.header
+        
+        writer.writerows(table.text_rows())
+        yield buffer.getvalue()
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def iter_ndjson(tables):
+    """One JSON object per transaction, keyed by the page's header, one chunk per page
+    
+    Amounts are JSON numbers and dates YYYY-MM-DD strings.
+    """
+    for table_info in tables:
+        table = table_info['data']
+        if not table:
+            continue
+        
+        columns = table_columns(table.header)
+        lines = []
+        for row in table:
+            record = {'page': table_info['page']}
+            record.update(zip(columns, map(_json_value, row)))
+            lines.append(json.dumps(record, ensure_ascii=False))
+        
+        yield '\n'.join(lines) + '\n'
+
+STREAM_WRITERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+
+def _arrow_column(pa, pc, table, col_idx, arrow_type):
+    """One column as an Arrow array, built from the table's buffers where it is typed"""
+    kind, column = table.kinds[col_idx], table.columns[col_idx]
+    
+    if arrow_type == pa.string():
+        if kind == TEXT:
+            return pa.array(column, pa.string())
+        # Blank typed cells stay null, as when _conform_page() casts a typed column
+        return pa.array([table.text(col_idx, row_idx) or None for row_idx in range(len(table))], pa.string())
+    
+    if kind == DATE:
+        ordinals = pa.Array.from_buffers(pa.int32(), len(column), [None, pa.py_buffer(column)])
+        days = pc.subtract(ordinals, pa.scalar(EPOCH_ORDINAL, pa.int32()))
+        return pc.if_else(pc.equal(ordinals, MISSING_DATE), pa.scalar(None, pa.date32()), days.cast(pa.date32()))
+    
+    paise = pa.Array.from_buffers(pa.int64(), len(column), [None, pa.py_buffer(column)])
+    paise = pc.if_else(pc.equal(paise, MISSING_AMOUNT), pa.scalar(None, pa.int64()), paise)
+    rupees = pc.multiply(paise.cast(pa.decimal128(19, 0)), pa.scalar(Decimal('0.01')))
+    return rupees.cast(pa.decimal128(*AMOUNT_DECIMAL))
+
+def _parquet_schema(pa, types):
+    arrow_types = {DATE: pa.date32(), AMOUNT: pa.decimal128(*AMOUNT_DECIMAL), TEXT: pa.string()}
+    return pa.schema([('page', pa.int32())] + [(name, arrow_types[kind]) for name, kind in types.items()])
+
+def _page_table(pa, pc, page_num, columns, table, schema):
+    values = {field.name: pa.nulls(len(table), field.type) for field in schema}
+    for col_idx, name in enumerate(columns):
+        values[name] = _arrow_column(pa, pc, table, col_idx, schema.field(name).type)
+    values['page'] = pa.array([page_num] * len(table), pa.int32())
+    return pa.table(values, schema=schema)
+
+def _conform_page(pa, page, schema):
+    """A row group written under an earlier schema, under schema; columns only ever widen to string"""
+    values = {}
+    for field in schema:
+        if field.name not in page.column_names:
+            values[field.name] = pa.nulls(page.num_rows, field.type)
+        else:
+            values[field.name] = page[field.name].cast(field.type)
+    return pa.table(values, schema=schema)
+
+def _widen_parquet(pa, pq, writer, output_path, schema):
+    """ParquetWriter for output_path under schema, carrying over the row groups written so far
+    
+    The earlier row groups are copied one at a time, so only one page
+    is held in memory.
+    """
+    if writer is None:
+        return pq.ParquetWriter(output_path, schema)
+    
+    writer.close()
+    previous_path = f"{output_path}.previous"
+    os.replace(output_path, previous_path)
+    try:
+        writer = pq.ParquetWriter(output_path, schema)
+        previous = pq.ParquetFile(previous_path)
+        for index in range(previous.num_row_groups):
+            writer.write_table(_conform_page(pa, previous.read_row_group(index), schema))
+    finally:
+        os.remove(previous_path)
+    return writer
+
+def write_parquet(tables, output_path):
+    """Write transactions to Parquet, one row group per page, as the pages arrive
+    
+    Columns are the union of the page headers in first-seen order, plus
+    the source page. Date and amount columns are date32 and
+    decimal(18, 2), converted straight from the table's arrays; a column
+    that has unparsed text on any page is kept as strings instead, with
+    blank cells null.
+    
+    Only the current page is held in memory. A page that adds a column,
+    or brings text into a typed one, widens the schema: the row groups
+    written so far are then copied into a new file under it, which for
+    a statement with one header never happens after the first page.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("Parquet output requires pyarrow")
+        return False
+    
+    writer = None
+    try:
+        types = {}
+        schema = _parquet_schema(pa, types)
+        
+        for table_info in tables:
+            table = table_info['data']
+            if not table:
+                continue
+            
+            columns = table_columns(table.header)
+            widened = dict(types)
+            for col_idx, name in enumerate(columns):
+                kind = TEXT if table.has_raw(col_idx) else table.kinds[col_idx]
+                widened[name] = kind if widened.get(name, kind) == kind else TEXT
+            
+            if writer is None or widened != types:
+                types = widened
+                schema = _parquet_schema(pa, types)
+                writer = _widen_parquet(pa, pq, writer, output_path, schema)
+            
+            writer.write_table(_page_table(pa, pc, table_info['page'], columns, table, schema))
+        
+        if writer is None:
+            writer = pq.ParquetWriter(output_path, schema)
+        writer.close()
+        return True
+    
+    except Exception as e:
+        print(f"Parquet creation error: {str(e)}")
+        if writer is not None:
+            writer.close()
+        return False
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from sqlalchemy.exc import IntegrityError
+from models import db, GuestConversion
+
+class GuestQuotaStore:
+    """Monthly guest conversion counts, served from memory
+    
+    Quota checks for display are answered from a per-process cache, so
+    anonymous and crawler traffic on /guest-convert costs no queries after
+    the first visit and never writes. Counts are loaded from
+    guest_conversion on a miss and re-read after cache_ttl seconds to pick
+    up conversions made through other gunicorn workers.
+    
+    The cache is never what admits an upload: reserve() counts the
+    conversion in guest_conversion directly, with a conditional UPDATE,
+    so the limit holds across workers. Rows are only created when a guest
+    actually converts.
+    """
+    
+    def __init__(self, app=None, cache_ttl=60, max_entries=10000):
+        self.app = None
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._counts = OrderedDict()  # (ip, month) -> (count, loaded_at)
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+    
+    @staticmethod
+    def _key(ip_address):
+        return ip_address, datetime.now().strftime('%Y-%m')
+    
+    def used(self, ip_address, fresh=False):
+        """Conversions this month for ip_address; fresh=True skips the cache"""
+        key = self._key(ip_address)
+        
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached and not fresh and time.monotonic() - cached[1] < self.cache_ttl:
+                self._counts.move_to_end(key)
+                return cached[0]
+        
+        guest = GuestConversion.query.filter_by(ip_address=key[0], month_year=key[1]).first()
+        count = guest.conversions_this_month if guest else 0
+        
+        with self._lock:
+            self._remember(key, count)
+        return count
+    
+    def can_convert(self, ip_address, limit, fresh=False):
+        return self.used(ip_address, fresh) < limit
+    
+    def reserve(self, ip_address, limit):
+        """Count a conversion against the monthly limit unless it is used up; True if counted
+        
+        Written straight to guest_conversion with a conditional UPDATE, so
+        uploads racing in any worker cannot go past limit. The caller
+        commits, together with the conversion, before anything else is
+        added to the session: a lost race to create the row rolls it back.
+        """
+        ip_address, month_year = self._key(ip_address)
+        now = datetime.utcnow()
+        
+        result = db.session.execute(
+            db.update(GuestConversion)
+            .where(GuestConversion.ip_address == ip_address, GuestConversion.month_year == month_year,
+                   GuestConversion.conversions_this_month < limit)
+            .values(conversions_this_month=GuestConversion.conversions_this_month + 1, last_conversion=now)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            exists = db.session.query(GuestConversion.id).filter_by(
+                ip_address=ip_address, month_year=month_year).first()
+            if exists or limit < 1:
+                return False
+            try:
+                db.session.add(GuestConversion(ip_address=ip_address, month_year=month_year,
+                                               conversions_this_month=1, last_conversion=now))
+                db.session.flush()
+            except IntegrityError:
+                # Another worker created the row first; take the quota from it instead
+                db.session.rollback()
+                return self.reserve(ip_address, limit)
+        
+        self._forget((ip_address, month_year))
+        return True
+    
+    def release(self, ip_address, reserved_at):
+        """Give back a conversion counted by reserve() at reserved_at (UTC), e.g. when it failed
+        
+        The caller commits.
+        """
+        # Months are counted in local time, as in _key()
+        month_year = reserved_at.replace(tzinfo=timezone.utc).astimezone().strftime('%Y-%m')
+        db.session.execute(
+            db.update(GuestConversion)
+            .where(GuestConversion.ip_address == ip_address, GuestConversion.month_year == month_year,
+                   GuestConversion.conversions_this_month > 0)
+            .values(conversions_this_month=GuestConversion.conversions_this_month - 1)
+            .execution_options(synchronize_session=False)
+        )
+        self._forget((ip_address, month_year))
+    
+    def _forget(self, key):
+        # The next check re-reads the stored count
+        with self._lock:
+            self._counts.pop(key, None)
+    
+    def _remember(self, key, count):
+        self._counts[key] = (count, time.monotonic())
+        self._counts.move_to_end(key)
+        while len(self._counts) > self.max_entries:
+            self._counts.popitem(last=False)
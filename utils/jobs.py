@@ -0,0 +1,373 @@
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models import db, User, Conversion, CreditTransaction
+from utils.pdf_converter import convert_pdf_to_excel, convert_pdf_to_stream, convert_batch, count_pdf_pages, CONVERTER_VERSION
+from utils.exporters import FILE_FORMATS, STREAM_FORMATS
+from utils.result_cache import ResultCache
+from utils.sandbox import SandboxPool, SandboxError
+from utils.admission import pid_alive
+from utils.uploads import batch_file_position
+from utils.metrics import time_stage, STAGE_SECONDS, CONVERSIONS
+
+class ConversionQueue:
+    """Local conversion job queue
+    
+    Conversion rows are the durable queue (status queued -> running ->
+    completed/failed) and a thread pool in each web worker drains it, so
+    no external broker is needed. Jobs are claimed with a conditional
+    UPDATE, which keeps a job from running twice across gunicorn workers.
+    
+    With SANDBOX_ENABLED the conversion itself runs in a SandboxPool
+    worker, so a PDF that loops or exhausts memory fails its own job
+    instead of taking the web worker down with it.
+    """
+    
+    def __init__(self, app=None, guest_quota=None, admission=None):
+        self.app = None
+        self.executor = None
+        self._reaper = None
+        self._stop = threading.Event()
+        self.result_caches = {}
+        self.sandbox = None
+        self.guest_quota = guest_quota
+        self.admission = admission
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config['CONVERSION_WORKERS'],
+            thread_name_prefix='conversion'
+        )
+        # One cache per stored format, told apart by file suffix; they share the folder's budget
+        self.result_caches = {
+            output_format: ResultCache(
+                app.config['RESULT_CACHE_FOLDER'],
+                app.config['RESULT_CACHE_MAX_BYTES'],
+                CONVERTER_VERSION,
+                suffix=f".{output_format}"
+            )
+            for output_format in FILE_FORMATS
+        }
+        if app.config['SANDBOX_ENABLED']:
+            self.sandbox = SandboxPool(
+                size=app.config['SANDBOX_WORKERS'],
+                memory_mb=app.config['SANDBOX_MEMORY_MB'],
+                cpu_seconds=app.config['SANDBOX_CPU_SECONDS'],
+                timeout=app.config['SANDBOX_TIMEOUT'],
+                max_tasks=app.config['SANDBOX_MAX_TASKS']
+            )
+    
+    def submit(self, conversion):
+        """Queue a conversion; cached results are completed inline"""
+        if not self._run(conversion.id, inline_only=True):
+            self.executor.submit(self._run, conversion.id)
+    
+    def _result_cache(self, conversion):
+        return self.result_caches[conversion.output_format or 'xlsx']
+    
+    def _fetch_cached(self, conversion):
+        """Place a cached result at the job's output path; False on a miss"""
+        if conversion.is_batch or not conversion.content_hash:
+            return False
+        output_path = os.path.join(self.app.config['CONVERTED_FOLDER'], conversion.converted_filename)
+        with time_stage('result_cache_lookup'):
+            return self._result_cache(conversion).get(conversion.content_hash, output_path)
+    
+    def resume_pending(self):
+        """Re-submit jobs left queued by a restarted worker, and jobs stuck running in one that died"""
+        self.reap_stuck()
+        for conversion in Conversion.query.filter_by(status='queued').all():
+            self.submit(conversion)
+    
+    def start(self):
+        """Check for stuck jobs every JOB_REAP_INTERVAL seconds in a background thread"""
+        if self._reaper is None and self.app.config['JOB_REAP_INTERVAL'] > 0:
+            self._reaper = threading.Thread(target=self._reap_loop, name='job-reaper', daemon=True)
+            self._reaper.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _reap_loop(self):
+        while not self._stop.wait(self.app.config['JOB_REAP_INTERVAL']):
+            with self.app.app_context():
+                try:
+                    for conversion in self.reap_stuck():
+                        self.submit(conversion)
+                except Exception as e:
+                    print(f"Job reaper error: {str(e)}")
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+    
+    def reap_stuck(self):
+        """Requeue running jobs whose worker died; returns the requeued conversions
+        
+        A job is stuck once the web worker that claimed it has exited or,
+        as a backstop for pid reuse, once it has been running for
+        JOB_STALE_SECONDS, longer than the sandbox lets a conversion take.
+        Streamed jobs are failed instead, refunding their credits: their
+        response died with the worker.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=self.app.config['JOB_STALE_SECONDS'])
+        requeued = []
+        
+        for conversion in Conversion.query.filter_by(status='running').all():
+            started_at = conversion.started_at or conversion.created_at
+            if started_at >= cutoff and (conversion.worker_pid is None or pid_alive(conversion.worker_pid)):
+                continue
+            
+            streamed = conversion.output_format in STREAM_FORMATS
+            # Conditional, as every gunicorn worker reaps; a claim since the read changes started_at
+            result = db.session.execute(
+                db.update(Conversion)
+                .where(Conversion.id == conversion.id, Conversion.status == 'running',
+                       Conversion.started_at == conversion.started_at)
+                .values(status='failed' if streamed else 'queued', started_at=None, worker_pid=None)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if result.rowcount != 1:
+                continue
+            db.session.refresh(conversion)
+            if streamed:
+                self._finish(conversion, 'failed', 'Conversion interrupted by a server restart')
+            else:
+                requeued.append(conversion)
+        
+        return requeued
+    
+    def _claim(self, conversion_id):
+        result = db.session.execute(
+            db.update(Conversion)
+            .where(Conversion.id == conversion_id, Conversion.status == 'queued')
+            .values(status='running', started_at=datetime.utcnow(), worker_pid=os.getpid())
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    
+    def _run(self, conversion_id, inline_only=False):
+        """Claim and process a job; with inline_only, only if its result is cached
+        
+        Returns False when inline_only left the job queued, so a result
+        evicted since the upload never runs a conversion in the request.
+        """
+        with self.app.app_context():
+            try:
+                if not self._claim(conversion_id):
+                    return True
+                conversion = db.session.get(Conversion, conversion_id)
+                
+                cached = None
+                if inline_only:
+                    cached = self._fetch_cached(conversion)
+                    if not cached:
+                        conversion.status, conversion.started_at, conversion.worker_pid = 'queued', None, None
+                        db.session.commit()
+                        return False
+                
+                STAGE_SECONDS.labels(stage='queue_wait').observe(
+                    (datetime.utcnow() - conversion.created_at).total_seconds())
+                with time_stage('job'):
+                    self._process(conversion, cached)
+            except Exception as e:
+                print(f"Conversion job {conversion_id} error: {str(e)}")
+                db.session.rollback()
+                self._finish(db.session.get(Conversion, conversion_id), 'failed', f"Error: {str(e)}")
+            finally:
+                db.session.remove()
+        return True
+    
+    def _process(self, conversion, cached=None):
+        """Convert a claimed job; cached says whether its result was already placed (None: look it up)"""
+        if conversion.is_batch:
+            return self._process_batch(conversion)
+        
+        upload_path = os.path.join(self.app.config['UPLOAD_FOLDER'], conversion.upload_filename)
+        output_path = os.path.join(self.app.config['CONVERTED_FOLDER'], conversion.converted_filename)
+        
+        result_cache = self._result_cache(conversion)
+        
+        try:
+            if cached is None:
+                cached = self._fetch_cached(conversion)
+            
+            if cached:
+                success, message = True, f"Converted {conversion.pages} page(s) (cached result)"
+            else:
+                success, pages_converted, message = self._convert(
+                    convert_pdf_to_excel, upload_path, output_path,
+                    workers=self.app.config['EXTRACTION_WORKERS'],
+                    parallel_min_pages=self.app.config['PARALLEL_MIN_PAGES'],
+                    text_engine=self.app.config['TEXT_ENGINE'],
+                    ocr=self._ocr_options(),
+                    output_format=conversion.output_format or 'xlsx',
+                    page_cache=self._page_cache_options()
+                )
+                if success:
+                    success, message = self._check_pages(conversion, pages_converted, message)
+                if success and conversion.content_hash:
+                    result_cache.put(conversion.content_hash, output_path)
+            
+            # Reserved credits are only settled once the workbook exists
+            if success:
+                success, message = self._charge(conversion, message)
+            
+            if not success and os.path.exists(output_path):
+                os.remove(output_path)
+            
+            self._finish(conversion, 'completed' if success else 'failed', message)
+        
+        finally:
+            # Clean up uploaded file
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+    
+    def _process_batch(self, conversion):
+        """Convert a folder of statements into one output; only statements with data are charged"""
+        batch_path = os.path.join(self.app.config['UPLOAD_FOLDER'], conversion.upload_filename)
+        output_path = os.path.join(self.app.config['CONVERTED_FOLDER'], conversion.converted_filename)
+        
+        try:
+            # Saved as NN_<name>, so ordering by NN keeps the upload order
+            statements = [(saved_name.split('_', 1)[1], os.path.join(batch_path, saved_name),
+                           count_pdf_pages(os.path.join(batch_path, saved_name)))
+                          for saved_name in sorted(os.listdir(batch_path), key=batch_file_position)]
+            
+            success, pages_converted, message = self._convert(
+                convert_batch, statements, output_path,
+                output_format=conversion.output_format,
+                workers=self.app.config['BATCH_WORKERS'],
+                text_engine=self.app.config['TEXT_ENGINE'],
+                ocr=self._ocr_options(),
+                page_cache=self._page_cache_options()
+            )
+            
+            if success:
+                CreditTransaction.settle(conversion.reservation_id, pages_converted)
+                conversion.credits_used = pages_converted
+            elif os.path.exists(output_path):
+                os.remove(output_path)
+            
+            self._finish(conversion, 'completed' if success else 'failed', message)
+        
+        finally:
+            shutil.rmtree(batch_path, ignore_errors=True)
+    
+    def stream(self, conversion):
+        """Convert in the calling request, yielding CSV/NDJSON chunks as pages are extracted
+        
+        Nothing is written to CONVERTED_FOLDER. Reserved credits are settled
+        once the last page has been sent; a dropped connection fails the
+        job and refunds them.
+        """
+        upload_path = os.path.join(self.app.config['UPLOAD_FOLDER'], conversion.upload_filename)
+        status, message = 'failed', 'Conversion interrupted'
+        rows = 0
+        
+        if not self._claim(conversion.id):
+            return
+        
+        try:
+            args = (upload_path, conversion.output_format, self.app.config['TEXT_ENGINE'],
+                    self._ocr_options(), self._page_cache_options())
+            chunks = self.sandbox.stream(convert_pdf_to_stream, *args) if self.sandbox else convert_pdf_to_stream(*args)
+            with time_stage('stream'):
+                for chunk, rows in chunks:
+                    yield chunk
+            
+            if rows:
+                success, message = self._charge(
+                    conversion, f"Converted {conversion.pages} page(s) with {rows} transaction(s)")
+                status = 'completed' if success else 'failed'
+            else:
+                message = "No transaction data found in PDF"
+        
+        except SandboxError as e:
+            print(f"Conversion job {conversion.id} stopped: {str(e)}")
+            message = str(e)
+        
+        except Exception as e:
+            print(f"Conversion job {conversion.id} error: {str(e)}")
+            db.session.rollback()
+            message = f"Error: {str(e)}"
+        
+        finally:
+            self._finish(conversion, status, message)
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+    
+    def _ocr_options(self):
+        return {
+            'workers': self.app.config['OCR_WORKERS'],
+            'cache_folder': self.app.config['OCR_CACHE_FOLDER'],
+            'cache_max_bytes': self.app.config['OCR_CACHE_MAX_BYTES']
+        }
+    
+    def _convert(self, convert, *args, **kwargs):
+        """convert(...) in the sandbox when enabled; (success, pages converted, message)"""
+        if self.sandbox is None:
+            return convert(*args, **kwargs)
+        
+        try:
+            return self.sandbox.run(convert, *args, **kwargs)
+        except SandboxError as e:
+            print(f"Sandboxed conversion stopped: {str(e)}")
+            return False, 0, str(e)
+    
+    def _page_cache_options(self):
+        return {
+            'folder': self.app.config['PAGE_CACHE_FOLDER'],
+            'max_bytes': self.app.config['PAGE_CACHE_MAX_BYTES']
+        }
+    
+    def _check_pages(self, conversion, pages_converted, message):
+        """Hold the job to the pages counted (and paid for) at upload; returns (success, message)
+        
+        A statement that turns out longer fails rather than being served
+        for less than it costs. A shorter one is charged what was converted.
+        """
+        if pages_converted > conversion.pages:
+            print(f"Conversion job {conversion.id}: converted {pages_converted} pages, {conversion.pages} counted at upload")
+            return False, (f"The statement has {pages_converted} pages but {conversion.pages} were counted "
+                           f"when it was uploaded. Please upload it again")
+        if pages_converted < conversion.pages:
+            conversion.pages = pages_converted
+            conversion.credits_used = min(conversion.credits_used, pages_converted)
+        return True, message
+    
+    def _charge(self, conversion, message):
+        """Settle the credit reservation; returns (success, message)"""
+        if conversion.reservation_id is not None:
+            CreditTransaction.settle(conversion.reservation_id, conversion.credits_used)
+        elif conversion.user_id is not None:
+            # Jobs queued before credits were reserved up front
+            user = db.session.get(User, conversion.user_id)
+            if not user.deduct_credits(conversion.credits_used, f"Conversion: {conversion.original_filename}"):
+                return False, f"Not enough credits. You need {conversion.credits_used} credits but have {user.credits}"
+        
+        return True, message
+    
+    def _finish(self, conversion, status, message):
+        if conversion is None:
+            return
+        newly_failed = status == 'failed' and conversion.status != 'failed'
+        conversion.status = status
+        conversion.message = message[:255]
+        if status == 'failed':
+            conversion.credits_used = 0
+            if conversion.reservation_id is not None:
+                CreditTransaction.refund(conversion.reservation_id)
+        if newly_failed and conversion.guest_ip and self.guest_quota is not None:
+            # Counted against the guest's monthly limit when it was uploaded
+            self.guest_quota.release(conversion.guest_ip, conversion.created_at)
+        conversion.completed_at = datetime.utcnow()
+        db.session.commit()
+        CONVERSIONS.labels(result=status).inc()
+        if self.admission is not None:
+            self.admission.release(conversion.admission_slot)
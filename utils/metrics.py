@@ -0,0 +1,92 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (Counter, Histogram, CollectorRegistry, generate_latest,
+                               CONTENT_TYPE_LATEST, REGISTRY)
+from prometheus_client import multiprocess
+
+# Conversion stages take from milliseconds (page count) to minutes (large OCR/extraction)
+STAGE_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    'cbs_stage_duration_seconds',
+    'Time spent in each conversion stage',
+    ['stage'],
+    buckets=STAGE_BUCKETS
+)
+
+REQUEST_SECONDS = Histogram(
+    'cbs_conversion_request_duration_seconds',
+    'Latency of the conversion endpoints',
+    ['endpoint'],
+    buckets=STAGE_BUCKETS
+)
+
+PAGES_PROCESSED = Counter(
+    'cbs_pages_processed_total',
+    'PDF pages run through extraction'
+)
+
+EXTRACTOR_ATTEMPTS = Counter(
+    'cbs_extractor_attempts_total',
+    'Page extraction attempts per extractor; result is hit or miss',
+    ['extractor', 'result']
+)
+
+PAGE_CACHE_LOOKUPS = Counter(
+    'cbs_page_cache_lookups_total',
+    'Per-page extraction cache lookups; result is hit or miss',
+    ['result']
+)
+
+RESULT_CACHE_LOOKUPS = Counter(
+    'cbs_result_cache_lookups_total',
+    'Converted file cache lookups; result is hit or miss',
+    ['result']
+)
+
+SANDBOX_FAILURES = Counter(
+    'cbs_sandbox_failures_total',
+    'Sandboxed conversions stopped early; reason is timeout, cpu, memory, crash or error',
+    ['reason']
+)
+
+ADMISSION_REJECTIONS = Counter(
+    'cbs_admission_rejections_total',
+    'Conversion requests turned away; reason is rate_limited (429) or busy (503)',
+    ['reason']
+)
+
+CONVERSIONS = Counter(
+    'cbs_conversions_total',
+    'Finished conversions by result',
+    ['result']
+)
+
+@contextmanager
+def time_stage(stage):
+    """Record the wall time of a block under cbs_stage_duration_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+def mark_process_dead(pid):
+    """Drop the live gauge samples of an exited process from the multiprocess store"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
+
+def render_metrics():
+    """Prometheus text exposition for /metrics
+    
+    Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR so
+    every worker (and extraction pool process) writes its samples there
+    and any worker can serve the merged view.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
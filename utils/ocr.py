@@ -0,0 +1,182 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from statistics import median
+from PIL import Image
+import pytesseract
+from pdf2image import convert_from_path
+from utils.result_cache import ResultCache
+
+# Bump when rasterizing or row reconstruction changes; keys the OCR cache
+OCR_VERSION = '1'
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+
+# Tesseract is most accurate around 300 dpi: aim for an A4-at-300dpi
+# width whatever the page size, within sane bounds
+TARGET_WIDTH_PX = 2480
+MIN_DPI = 150
+MAX_DPI = 400
+
+# A horizontal gap wider than this many word heights starts a new cell
+COLUMN_GAP_RATIO = 1.5
+
+class OCRPage:
+    """Page-like view of OCR output, so the registered extractors run on it unchanged"""
+    
+    def __init__(self, page_number, rows):
+        self.page_number = page_number
+        self.rows = rows
+    
+    def extract_text(self):
+        return '\n'.join(' '.join(cell for cell in row if cell) for row in self.rows)
+    
+    def extract_tables(self):
+        return [self.rows] if self.rows else []
+
+def is_image_file(path):
+    return '.' in path and path.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+def image_page_count(image_path):
+    """Uploaded images are single-page documents; 0 if the file is not a readable image"""
+    try:
+        with Image.open(image_path) as image:
+            image.verify()
+        return 1
+    except Exception as e:
+        print(f"Error reading image: {str(e)}")
+        return 0
+
+def adaptive_dpi(width_pt):
+    """Rasterization DPI for a page width in PDF points"""
+    dpi = TARGET_WIDTH_PX / (width_pt / 72)
+    return int(max(MIN_DPI, min(MAX_DPI, dpi)))
+
+def _prepare_image(image):
+    image = image.convert('L')
+    # Phone photos and screenshots are often too small for Tesseract
+    if image.width < TARGET_WIDTH_PX // 2:
+        scale = (TARGET_WIDTH_PX // 2) / image.width
+        image = image.resize((int(image.width * scale), int(image.height * scale)), Image.LANCZOS)
+    return image
+
+def _ocr_lines(image):
+    """Tesseract words grouped into visual lines: [(top, [(left, right, height, word)])]"""
+    data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    lines = {}
+    
+    for i, word in enumerate(data['text']):
+        word = word.strip()
+        if not word or float(data['conf'][i]) < 0:
+            continue
+        key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        line = lines.setdefault(key, [data['top'][i], []])
+        line[0] = min(line[0], data['top'][i])
+        line[1].append((data['left'][i], data['left'][i] + data['width'][i], data['height'][i], word))
+    
+    return sorted((top, sorted(words)) for top, words in lines.values())
+
+def _split_cells(words, gap):
+    cells = []
+    for left, right, height, word in words:
+        if cells and left - cells[-1][1] <= gap:
+            cells[-1][1] = right
+            cells[-1][2].append(word)
+        else:
+            cells.append([left, right, [word]])
+    return [(left, ' '.join(text)) for left, right, text in cells]
+
+def rows_from_lines(lines):
+    """Rebuild table rows from OCR lines
+    
+    Cells are split on wide horizontal gaps, then aligned to the column
+    starts of the line with the most cells (usually the header), giving
+    the same list-of-rows shape the PDF extractors produce.
+    """
+    heights = [height for top, words in lines for left, right, height, word in words]
+    if not heights:
+        return []
+    gap = median(heights) * COLUMN_GAP_RATIO
+    
+    split_lines = [_split_cells(words, gap) for top, words in lines]
+    columns = [left for left, text in max(split_lines, key=len)]
+    
+    rows = []
+    for cells in split_lines:
+        row = [''] * len(columns)
+        for left, text in cells:
+            # Last column starting at or before this cell (allowing for jitter)
+            index = 0
+            for col_idx, column_left in enumerate(columns):
+                if column_left <= left + gap:
+                    index = col_idx
+            row[index] = f"{row[index]} {text}".strip()
+        rows.append(row)
+    
+    return rows
+
+# One cache per folder in each process, so its size estimate carries across
+# pages instead of every write rescanning the folder
+_caches = {}
+_caches_lock = threading.Lock()
+
+def _cache(cache_folder, cache_max_bytes):
+    """This process's OCR ResultCache for cache_folder; None (no caching) without a folder"""
+    if not cache_folder:
+        return None
+    
+    key = (cache_folder, cache_max_bytes)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResultCache(cache_folder, cache_max_bytes, OCR_VERSION, suffix='.json')
+        return _caches[key]
+
+def ocr_image(image, cache=None):
+    """OCR rows for one image, cached on a hash of its pixels"""
+    image = _prepare_image(image)
+    image_hash = hashlib.sha256(image.tobytes()).hexdigest()
+    
+    if cache is not None:
+        cached = cache.read(image_hash)
+        if cached is not None:
+            return json.loads(cached)
+    
+    rows = rows_from_lines(_ocr_lines(image))
+    
+    if cache is not None:
+        cache.write(image_hash, json.dumps(rows).encode())
+    return rows
+
+def ocr_pdf_page(pdf_path, page_number, width_pt, cache_folder=None, cache_max_bytes=0):
+    """Pool worker: rasterize one PDF page at adaptive DPI and OCR it"""
+    images = convert_from_path(pdf_path, dpi=adaptive_dpi(width_pt),
+                               first_page=page_number, last_page=page_number)
+    return ocr_image(images[0], _cache(cache_folder, cache_max_bytes))
+
+def ocr_image_file(image_path, cache_folder=None, cache_max_bytes=0):
+    with Image.open(image_path) as image:
+        return ocr_image(image, _cache(cache_folder, cache_max_bytes))
+
+def ocr_pdf_pages(pdf_path, pages, workers=1, cache_folder=None, cache_max_bytes=0):
+    """OCR the given (page_number, width_pt) pages; returns {page_number: OCRPage}
+    
+    Each page costs seconds of Tesseract time, so a short-lived process
+    pool is worth its startup even for a couple of pages.
+    """
+    results = {}
+    
+    if workers <= 1 or len(pages) <= 1:
+        for page_number, width_pt in pages:
+            rows = ocr_pdf_page(pdf_path, page_number, width_pt, cache_folder, cache_max_bytes)
+            results[page_number] = OCRPage(page_number, rows)
+        return results
+    
+    with ProcessPoolExecutor(max_workers=min(workers, len(pages))) as pool:
+        futures = {page_number: pool.submit(ocr_pdf_page, pdf_path, page_number, width_pt,
+                                            cache_folder, cache_max_bytes)
+                   for page_number, width_pt in pages}
+        for page_number, future in futures.items():
+            results[page_number] = OCRPage(page_number, future.result())
+    
+    return results
@@ -0,0 +1,75 @@
+import hashlib
+import json
+from pdfminer.pdftypes import PDFStream, resolve1
+from utils.result_cache import ResultCache
+from utils.transactions import TransactionTable
+from utils.metrics import PAGE_CACHE_LOOKUPS
+
+def _stream_data(obj):
+    obj = resolve1(obj)
+    return obj.get_data() if isinstance(obj, PDFStream) else b''
+
+def page_fingerprint(page_obj):
+    """SHA-256 over what a page's extracted table depends on
+    
+    Covers the page size, its content streams, and for each font the
+    name, encoding and ToUnicode map, since subset fonts can map the same
+    bytes to different text. Object numbers are left out, so the same
+    page in a different statement PDF hashes the same.
+    """
+    digest = hashlib.sha256()
+    digest.update(repr([round(float(value), 2) for value in page_obj.mediabox]).encode())
+    
+    for stream in page_obj.contents:
+        digest.update(_stream_data(stream))
+    
+    resources = resolve1(page_obj.resources) or {}
+    fonts = resolve1(resources.get('Font')) or {}
+    for name in sorted(fonts):
+        font = resolve1(fonts[name]) or {}
+        encoding = resolve1(font.get('Encoding'))
+        if isinstance(encoding, dict):
+            encoding = (encoding.get('BaseEncoding'), resolve1(encoding.get('Differences')))
+        digest.update(f"{name}|{font.get('BaseFont')}|{encoding}|".encode())
+        digest.update(_stream_data(font.get('ToUnicode')))
+    
+    # Form XObjects draw text and rules of their own
+    xobjects = resolve1(resources.get('XObject')) or {}
+    for name in sorted(xobjects):
+        xobject = resolve1(xobjects[name])
+        if isinstance(xobject, PDFStream) and str(xobject.get('Subtype')) == '/Form':
+            digest.update(name.encode())
+            digest.update(xobject.get_data())
+    
+    return digest.hexdigest()
+
+class PageCache:
+    """Extracted tables of individual pages, keyed on their content
+    
+    Customers re-upload overlapping statements (a quarter, then the whole
+    year), so a page seen before is served from disk instead of going
+    through the extractors again. Keys combine page_fingerprint() with the
+    document's detected format; the converter version is part of every
+    entry name. Pages without a table are cached too. Size-bounded LRU on
+    top of ResultCache.
+    """
+    
+    def __init__(self, folder, max_bytes, version):
+        self.store = ResultCache(folder, max_bytes, version, suffix='.page.json')
+    
+    @staticmethod
+    def key(page_obj, doc_format=None):
+        return hashlib.sha256(f"{page_fingerprint(page_obj)}|{doc_format or ''}".encode()).hexdigest()
+    
+    def get(self, key):
+        """(True, table or None) on a hit, (False, None) on a miss"""
+        data = self.store.read(key)
+        PAGE_CACHE_LOOKUPS.labels(result='miss' if data is None else 'hit').inc()
+        if data is None:
+            return False, None
+        
+        table = json.loads(data)
+        return True, TransactionTable.from_dict(table) if table else None
+    
+    def put(self, key, table):
+        self.store.write(key, json.dumps(table.to_dict() if table else None).encode())
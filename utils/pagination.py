@@ -0,0 +1,34 @@
+from datetime import datetime
+from models import db
+
+PER_PAGE = 20
+
+def encode_cursor(item):
+    return f"{item.created_at.isoformat()}_{item.id}"
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor string, or None if it is missing or malformed"""
+    try:
+        created_at, item_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (AttributeError, ValueError):
+        return None
+
+def keyset_page(query, model, cursor=None, per_page=PER_PAGE):
+    """Newest-first page of query after cursor; returns (items, next_cursor)
+    
+    Seeks on (created_at, id) instead of using OFFSET, so every page
+    costs the same index range scan however deep the user pages.
+    """
+    position = decode_cursor(cursor)
+    if position:
+        created_at, item_id = position
+        query = query.filter(db.or_(
+            model.created_at < created_at,
+            db.and_(model.created_at == created_at, model.id < item_id)
+        ))
+    
+    items = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+    
+    next_cursor = encode_cursor(items[per_page - 1]) if len(items) > per_page else None
+    return items[:per_page], next_cursor
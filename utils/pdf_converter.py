@@ -1,18 +1,232 @@
 import pdfplumber
+from pdfplumber.utils import extract_text as chars_to_text
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
 import os
 import re
+import tempfile
+import threading
+import zipfile
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import chain
 from datetime import datetime
+from utils.text_engine import extract_text_fast
+from utils.ocr import OCRPage, is_image_file, image_page_count, ocr_image_file, ocr_pdf_pages
+from utils.exporters import write_parquet, STREAM_WRITERS
+from utils.page_cache import PageCache
+from utils.transactions import TransactionTable, stitch_pages, DATE, AMOUNT, TEXT
+from utils.uploads import pdf_page_count
+from utils.metrics import time_stage, PAGES_PROCESSED, EXTRACTOR_ATTEMPTS
+
+# Bump whenever extraction or workbook output changes; keys cached results
+CONVERTER_VERSION = '4'
+
+# Below this many pages, process pool startup and IPC cost more than they save
+PARALLEL_MIN_PAGES = 8
+
+# 'fast' reads text straight from the content stream (utils.text_engine);
+# 'pdfplumber' runs its full character-level layout analysis
+TEXT_ENGINE = 'fast'
+
+# Called with each page number as its extraction starts; the conversion
+# sandbox (utils.sandbox) sets it to report where a stopped conversion got to
+page_progress = None
+
+# Run in each extraction pool process as it starts; the sandbox sets it
+# to lift the process's CPU limit and record its pid
+extraction_pool_initializer = None
+
+def _extract_table_text(tables):
+    """Cell text of pdfplumber tables found on one page, as Table.extract() returns it
+    
+    Table.extract() tests every char on the page against every row.
+    Here the chars are ordered by vertical midpoint once per page and
+    each row bisects out its own band, keeping page order within it.
+    """
+    if not tables:
+        return []
+    
+    chars = tables[0].page.chars
+    order = sorted(range(len(chars)), key=lambda i: (chars[i]['top'] + chars[i]['bottom']) / 2)
+    mids = [(chars[i]['top'] + chars[i]['bottom']) / 2 for i in order]
+    
+    extracted = []
+    for table in tables:
+        rows = []
+        for row in table.rows:
+            x0, top, x1, bottom = row.bbox
+            band = sorted(order[bisect_left(mids, top):bisect_left(mids, bottom)])
+            row_chars = [chars[i] for i in band if x0 <= (chars[i]['x0'] + chars[i]['x1']) / 2 < x1]
+            
+            cells = []
+            for cell in row.cells:
+                if cell is None:
+                    cells.append(None)
+                    continue
+                cell_chars = [char for char in row_chars
+                              if cell[0] <= (char['x0'] + char['x1']) / 2 < cell[2] and
+                              cell[1] <= (char['top'] + char['bottom']) / 2 < cell[3]]
+                cells.append(chars_to_text(cell_chars, x_shift=cell[0], y_shift=cell[1]) if cell_chars else '')
+            rows.append(cells)
+        extracted.append(rows)
+    
+    return extracted
+
+class CachedPage:
+    """Page wrapper that runs each expensive pdfplumber call at most once"""
+    
+    def __init__(self, page, document=None):
+        self.page = page
+        self.document = document
+        self.page_number = page.page_number
+        self._tables = None
+        self._text = None
+    
+    def extract_tables(self):
+        if self._tables is None:
+            self._tables = _extract_table_text(self.page.find_tables())
+        return self._tables
+    
+    def release(self):
+        """Drop everything parsed for this page once it has been extracted
+        
+        pdfplumber keeps a page's layout objects for the life of the
+        document; without this, memory grows with every page processed.
+        """
+        self.page.flush_cache()
+        self._tables = self._text = None
+    
+    def extract_text(self):
+        if self._text is None:
+            if self.document is not None and self.document.text_engine == 'fast':
+                try:
+                    self._text = extract_text_fast(self.page.page_obj, self.document.pdf.rsrcmgr)
+                except Exception as e:
+                    print(f"Fast text engine error, using pdfplumber: {str(e)}")
+            if self._text is None:
+                self._text = self.page.extract_text()
+        return self._text
+
+class PDFDocument:
+    """Single open PDF shared by page counting, credit checks, extraction and summary"""
+    
+    def __init__(self, pdf_path, text_engine=TEXT_ENGINE, page_cache=None):
+        self.pdf_path = pdf_path
+        self.text_engine = text_engine
+        self.is_image = is_image_file(pdf_path)
+        self.page_cache = _page_cache(page_cache)
+        self.pdf = None
+        self._pages = None
+        self._page_count = None
+    
+    def open(self):
+        if self.pdf is None:
+            self.pdf = pdfplumber.open(self.pdf_path)
+        return self.pdf
+    
+    @property
+    def page_count(self):
+        if self._page_count is None:
+            try:
+                with time_stage('count_pages'):
+                    if self.is_image:
+                        self._page_count = image_page_count(self.pdf_path)
+                    else:
+                        self._page_count = len(self.open().pages)
+            except Exception as e:
+                print(f"Error counting pages: {str(e)}")
+                self._page_count = 0
+        return self._page_count
+    
+    @property
+    def pages(self):
+        if self._pages is None:
+            self._pages = [CachedPage(page, self) for page in self.open().pages]
+        return self._pages
+    
+    def close(self):
+        if self.pdf is not None:
+            self.pdf.close()
+            self.pdf = None
+        self._pages = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# One PageCache per folder in each process, so its size estimate (which
+# spares a folder scan per write) carries over between conversions
+_page_caches = {}
+_page_caches_lock = threading.Lock()
+
+def _page_cache(options):
+    """This process's PageCache for {'folder', 'max_bytes'} options; None (no caching) without a folder"""
+    if not options or not options.get('folder'):
+        return None
+    
+    key = (options['folder'], options.get('max_bytes', 0))
+    with _page_caches_lock:
+        if key not in _page_caches:
+            _page_caches[key] = PageCache(options['folder'], options.get('max_bytes', 0), CONVERTER_VERSION)
+        return _page_caches[key]
 
 def count_pdf_pages(pdf_path):
+    """Page count without opening the document in pdfplumber"""
+    if is_image_file(pdf_path):
+        return image_page_count(pdf_path)
+    return pdf_page_count(pdf_path)[0]
+
+# Registered page extractors, in fallback cascade order
+EXTRACTORS = []
+
+def register_extractor(name, detect=None):
+    """Register a page extractor for a bank/statement format
+    
+    detect(text, metadata) receives the first page's text and the PDF
+    metadata and returns True when the whole document is in this format.
+    Extractors without detect only take part in the fallback cascade.
+    """
+    def decorator(extract):
+        EXTRACTORS.append({'name': name, 'extract': extract, 'detect': detect})
+        return extract
+    return decorator
+
+def _metadata_text(metadata):
+    return ' '.join(str(metadata.get(key, '')) for key in ('Producer', 'Creator', 'Title')).lower()
+
+def _detect_sbi(text, metadata):
+    text_lower = text.lower()
+    return ('state bank of india' in text_lower or 'txn date' in text_lower or
+            'state bank of india' in _metadata_text(metadata))
+
+def _detect_phonepe(text, metadata):
+    return ('Transaction Statement' in text or 'phonepe' in text.lower() or
+            'phonepe' in _metadata_text(metadata))
+
+def detect_format(document):
+    """Fingerprint the document once from its first page; None if no extractor claims it"""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            return len(pdf.pages)
+        if document.is_image or document.page_count == 0:
+            return None
+        
+        text = document.pages[0].extract_text() or ''
+        metadata = document.open().metadata or {}
+        
+        for extractor in EXTRACTORS:
+            if extractor['detect'] and extractor['detect'](text, metadata):
+                return extractor['name']
     except Exception as e:
-        print(f"Error counting pages: {str(e)}")
-        return 0
+        print(f"Format detection error: {str(e)}")
+    
+    return None
 
+@register_extractor('sbi', detect=_detect_sbi)
 def extract_sbi_format(page):
     """Extract SBI bank statement format"""
     try:
@@ -35,106 +249,98 @@ def extract_sbi_format(page):
                             if any(cleaned_row):
                                 cleaned_table.append(cleaned_row)
                     
-                    return cleaned_table
+                    return TransactionTable.from_rows(cleaned_table) if cleaned_table else None
     except Exception as e:
         print(f"SBI extraction error: {str(e)}")
     
     return None
 
+PHONEPE_DATE_RE = re.compile(r'([A-Z][a-z]{2}\s+\d{1,2},\s+\d{4})')  # "Sep 07, 2024"
+PHONEPE_TIME_RE = re.compile(r'\d{2}:\d{2}\s+(am|pm)')
+PHONEPE_HEADER = ['Date', 'Time', 'Transaction Details', 'Transaction ID', 'UTR No', 'Type', 'Amount']
+
+@register_extractor('phonepe', detect=_detect_phonepe)
 def extract_phonepe_format(page):
-    """Extract PhonePe/UPI statement format"""
+    """Extract PhonePe/UPI statement format
+    
+    Single pass over the page's lines: a date line opens a transaction,
+    an optional time line follows it, detail lines fill it in, and a page
+    footer closes it until the next date.
+    """
     try:
         text = page.extract_text()
         if not text:
             return None
         
-        lines = text.split('\n')
+        # PhonePe format detection
+        if 'Transaction Statement' not in text and 'phonepe' not in text.lower():
+            return None
+        
         transactions = []
+        current = None
+        expect_time = False
+        collecting = False
         
-        # PhonePe format detection
-        if 'Transaction Statement' in text or 'phonepe' in text.lower():
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-                
-                # Date pattern: "Sep 07, 2024" or "Aug 31, 2024"
-                date_match = re.match(r'([A-Z][a-z]{2}\s+\d{1,2},\s+\d{4})', line)
-                
-                if date_match:
-                    date = date_match.group(1)
-                    time = ''
-                    description = ''
-                    transaction_type = ''
-                    amount = ''
-                    transaction_id = ''
-                    utr_no = ''
-                    
-                    # Next line might be time
-                    if i + 1 < len(lines):
-                        time_line = lines[i + 1].strip()
-                        if re.match(r'\d{2}:\d{2}\s+(am|pm)', time_line):
-                            time = time_line
-                            i += 1
-                    
-                    # Next lines contain transaction details
-                    while i + 1 < len(lines):
-                        i += 1
-                        detail_line = lines[i].strip()
-                        
-                        # Check for next date (end of this transaction)
-                        if re.match(r'([A-Z][a-z]{2}\s+\d{1,2},\s+\d{4})', detail_line):
-                            i -= 1  # Go back one line
-                            break
-                        
-                        # Description (Paid to, Received from)
-                        if detail_line.startswith(('Paid to', 'Received from')):
-                            description = detail_line
-                        
-                        # Transaction ID
-                        elif detail_line.startswith('Transaction ID'):
-                            transaction_id = detail_line.replace('Transaction ID', '').strip()
-                        
-                        # UTR Number
-                        elif detail_line.startswith('UTR No'):
-                            utr_no = detail_line.replace('UTR No', '').replace('.', '').strip()
-                        
-                        # Type (DEBIT/CREDIT) and Amount
-                        elif 'DEBIT' in detail_line or 'CREDIT' in detail_line:
-                            parts = detail_line.split()
-                            for part in parts:
-                                if part in ['DEBIT', 'CREDIT']:
-                                    transaction_type = part
-                                elif part.startswith('₹'):
-                                    amount = part.replace('₹', '').replace(',', '')
-                        
-                        # Check if we hit a separator or page info
-                        if 'Page' in detail_line or detail_line.startswith('This is a system'):
-                            break
-                    
-                    # Add transaction if we have minimum data
-                    if date and description:
-                        transactions.append([
-                            date,
-                            time,
-                            description,
-                            transaction_id,
-                            utr_no,
-                            transaction_type,
-                            amount
-                        ])
-                
-                i += 1
+        for line in text.split('\n'):
+            line = line.strip()
             
-            if transactions:
-                # Add header
-                header = ['Date', 'Time', 'Transaction Details', 'Transaction ID', 'UTR No', 'Type', 'Amount']
-                return [header] + transactions
+            date_match = PHONEPE_DATE_RE.match(line)
+            if date_match:
+                # Add previous transaction if we have minimum data
+                if current and current[2]:
+                    transactions.append(current)
+                # [date, time, description, transaction_id, utr_no, type, amount]
+                current = [date_match.group(1), '', '', '', '', '', '']
+                expect_time = True
+                collecting = True
+                continue
+            
+            if not collecting:
+                continue
+            
+            # Line right after the date might be time
+            if expect_time:
+                expect_time = False
+                if PHONEPE_TIME_RE.match(line):
+                    current[1] = line
+                    continue
+            
+            # Description (Paid to, Received from)
+            if line.startswith(('Paid to', 'Received from')):
+                current[2] = line
+            
+            # Transaction ID
+            elif line.startswith('Transaction ID'):
+                current[3] = line.replace('Transaction ID', '').strip()
+            
+            # UTR Number
+            elif line.startswith('UTR No'):
+                current[4] = line.replace('UTR No', '').replace('.', '').strip()
+            
+            # Type (DEBIT/CREDIT) and Amount
+            elif 'DEBIT' in line or 'CREDIT' in line:
+                for part in line.split():
+                    if part in ('DEBIT', 'CREDIT'):
+                        current[5] = part
+                    elif part.startswith('₹'):
+                        current[6] = part
+            
+            # A separator or page info ends the transaction
+            if 'Page' in line or line.startswith('This is a system'):
+                collecting = False
+        
+        if current and current[2]:
+            transactions.append(current)
+        
+        if transactions:
+            return TransactionTable(PHONEPE_HEADER, transactions)
     
     except Exception as e:
         print(f"PhonePe extraction error: {str(e)}")
     
     return None
 
+@register_extractor('generic')
 def extract_generic_table(page):
     """Generic table extraction for unknown formats"""
     try:
@@ -150,121 +356,387 @@ def extract_generic_table(page):
                             cleaned_table.append(cleaned_row)
                 
                 if len(cleaned_table) > 2:
-                    return cleaned_table
+                    return TransactionTable.from_rows(cleaned_table)
     
     except Exception as e:
         print(f"Generic extraction error: {str(e)}")
     
     return None
 
-def extract_data_from_pdf(pdf_path):
-    """Main extraction with format detection"""
+def extract_page(page, doc_format=None):
+    """Extract a page with the document's detected extractor
+    
+    Falls back to the registered cascade (SBI -> PhonePe -> generic) when
+    the format is unknown or its extractor finds nothing on this page.
+    
+    With the document's page cache enabled, a page whose content was
+    extracted before (in any statement) is served from the cache and
+    never reaches the extractors.
+    """
+    if page_progress is not None:
+        page_progress(page.page_number)
+    
+    page_cache = page.document.page_cache if isinstance(page, CachedPage) and page.document is not None else None
+    if page_cache is not None:
+        try:
+            with time_stage('page_cache_lookup'):
+                cache_key = page_cache.key(page.page.page_obj, doc_format)
+                cached, extracted_table = page_cache.get(cache_key)
+            if cached:
+                return extracted_table
+        except Exception as e:
+            print(f"Page cache error: {str(e)}")
+            page_cache = None
+    
+    extracted_table = _extract_page_cascade(page, doc_format)
+    
+    if page_cache is not None:
+        page_cache.put(cache_key, extracted_table)
+    
+    return extracted_table
+
+def _extract_page_cascade(page, doc_format=None):
+    tried = None
+    
+    for extractor in EXTRACTORS:
+        if extractor['name'] == doc_format:
+            extracted_table = _run_extractor(extractor, page)
+            if extracted_table:
+                return extracted_table
+            tried = extractor
+            break
+    
+    for extractor in EXTRACTORS:
+        if extractor is not tried:
+            extracted_table = _run_extractor(extractor, page)
+            if extracted_table:
+                return extracted_table
+    
+    return None
+
+def _run_extractor(extractor, page):
+    with time_stage(f"extractor_{extractor['name']}"):
+        extracted_table = extractor['extract'](page)
+    EXTRACTOR_ATTEMPTS.labels(extractor=extractor['name'], result='hit' if extracted_table else 'miss').inc()
+    return extracted_table
+
+def _extract_pages(pages, start=1, doc_format=None):
+    tables = []
+    for page_num, page in enumerate(pages, start=start):
+        extracted_table = extract_page(page, doc_format)
+        page.release()
+        PAGES_PROCESSED.inc()
+        
+        if extracted_table:
+            tables.append({
+                'page': page_num,
+                'data': extracted_table
+            })
+    
+    return tables
+
+def _extract_page_range(pdf_path, start, stop, doc_format=None, text_engine=TEXT_ENGINE, page_cache=None):
+    """Pool worker: open the PDF in this process and extract pages start..stop-1"""
+    with PDFDocument(pdf_path, text_engine, page_cache) as document:
+        return _extract_pages(document.pages[start - 1:stop - 1], start=start, doc_format=doc_format)
+
+def _page_ranges(page_count, workers):
+    """Split 1..page_count into contiguous shards, a couple per worker for balance"""
+    shard_size = max(1, -(-page_count // (workers * 2)))
+    return [(start, min(start + shard_size, page_count + 1))
+            for start in range(1, page_count + 1, shard_size)]
+
+_extraction_pool = None
+_extraction_pool_size = 0
+
+def _get_extraction_pool(workers):
+    # Created lazily so each gunicorn worker forks its own pool after startup.
+    # Only replaced to grow: a larger pool serves smaller requests too, and
+    # every new process adds its own files to the metrics store
+    global _extraction_pool, _extraction_pool_size
+    if _extraction_pool is None or _extraction_pool_size < workers:
+        if _extraction_pool is not None:
+            _extraction_pool.shutdown(wait=False)
+        _extraction_pool = ProcessPoolExecutor(max_workers=workers, initializer=extraction_pool_initializer)
+        _extraction_pool_size = workers
+    return _extraction_pool
+
+def _extract_parallel(pdf_path, page_count, workers, doc_format=None, text_engine=TEXT_ENGINE, page_cache=None):
+    pool = _get_extraction_pool(workers)
+    ranges = _page_ranges(page_count, workers)
+    futures = [pool.submit(_extract_page_range, pdf_path, start, stop, doc_format, text_engine, page_cache)
+               for start, stop in ranges]
+    
+    # Shards are submitted in page order, so collecting in the same order keeps it
     all_tables = []
+    for future in futures:
+        all_tables.extend(future.result())
+    return all_tables
+
+def extract_data_from_pdf(pdf_path, document=None, workers=1, parallel_min_pages=PARALLEL_MIN_PAGES,
+                          text_engine=TEXT_ENGINE, ocr=None, page_cache=None):
+    """Main extraction with format detection
+    
+    With workers > 1, documents of at least parallel_min_pages pages are
+    sharded across a process pool; shorter ones stay sequential because
+    pool overhead would dominate.
+    
+    Images, and PDF pages without a text layer, are OCR'd; ocr holds
+    the workers/cache_folder/cache_max_bytes options (False disables it).
+    Pages are stitched into one continuous table (see stitch_pages).
+    page_cache holds the folder/max_bytes options of the per-page cache
+    (see extract_page); a caller's document brings its own.
+    """
+    all_tables = None
+    ocr = {} if ocr is None else ocr
     
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                extracted_table = None
-                
-                # Try different extraction methods
-                # 1. Try SBI format
-                extracted_table = extract_sbi_format(page)
-                
-                # 2. Try PhonePe format
-                if not extracted_table:
-                    extracted_table = extract_phonepe_format(page)
-                
-                # 3. Try generic table extraction
-                if not extracted_table:
-                    extracted_table = extract_generic_table(page)
+        with _document_session(pdf_path, document, text_engine, page_cache) as document:
+            if not document.is_image and workers > 1 and document.page_count >= parallel_min_pages:
+                with time_stage('detect_format'):
+                    doc_format = detect_format(document)
+                try:
+                    all_tables = _extract_parallel(pdf_path, document.page_count, workers, doc_format,
+                                                   document.text_engine, page_cache)
+                except Exception as e:
+                    print(f"Parallel extraction error, falling back to sequential: {str(e)}")
                 
-                if extracted_table:
-                    all_tables.append({
-                        'page': page_num,
-                        'data': extracted_table
-                    })
+                if all_tables is not None and ocr is not False and len(all_tables) < document.page_count:
+                    all_tables = _ocr_scanned_pages(pdf_path, document, all_tables, ocr)
+            
+            if all_tables is None:
+                return list(iter_extracted_pages(pdf_path, document, ocr=ocr))
     
     except Exception as e:
         print(f"PDF extraction error: {str(e)}")
     
-    return all_tables
+    return list(stitch_pages(all_tables or []))
 
-def normalize_table(table_data):
-    """Ensure all rows have same number of columns"""
-    if not table_data:
+def _extract_image(image_path, ocr):
+    try:
+        with time_stage('ocr'):
+            rows = ocr_image_file(image_path, ocr.get('cache_folder'), ocr.get('cache_max_bytes', 0))
+    except Exception as e:
+        print(f"OCR error: {str(e)}")
         return []
     
-    max_cols = max(len(row) for row in table_data)
+    extracted_table = extract_page(OCRPage(1, rows))
+    return [{'page': 1, 'data': extracted_table}] if extracted_table else []
+
+def _ocr_scanned_pages(pdf_path, document, all_tables, ocr):
+    """OCR pages that produced no table and have no text layer, merging them in page order"""
+    found = {table['page'] for table in all_tables}
+    scanned = [(page.page_number, float(page.page.width)) for page in document.pages
+               if page.page_number not in found and not (page.extract_text() or '').strip()]
     
-    normalized = []
-    for row in table_data:
-        if len(row) < max_cols:
-            row = row + [''] * (max_cols - len(row))
-        normalized.append(row[:max_cols])
+    if not scanned:
+        return all_tables
     
-    return normalized
-
-def create_excel_from_tables(tables, output_path):
-    """Create formatted Excel file"""
     try:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Transactions"
+        with time_stage('ocr'):
+            ocr_pages = ocr_pdf_pages(pdf_path, scanned, **ocr)
+    except Exception as e:
+        print(f"OCR error: {str(e)}")
+        return all_tables
+    
+    for page_num, page in ocr_pages.items():
+        extracted_table = extract_page(page)
+        if extracted_table:
+            all_tables.append({
+                'page': page_num,
+                'data': extracted_table
+            })
+    
+    return sorted(all_tables, key=lambda table: table['page'])
+
+def iter_extracted_pages(pdf_path, document=None, text_engine=TEXT_ENGINE, ocr=None, page_cache=None):
+    """Yield {'page', 'data'} tables one page at a time
+    
+    The sequential extraction path, used for streamed responses and for
+    file conversions that are not sharded across the process pool. Each
+    page's pdfplumber objects are released as soon as it is extracted,
+    so peak memory is bounded by the largest page plus the compact
+    tables already yielded but not yet consumed (stitching holds one page
+    back), regardless of page count. Runs of text-less pages are OCR'd
+    together, up to ocr['workers'] at a time.
+    """
+    return stitch_pages(_iter_pages(pdf_path, document, text_engine, ocr, page_cache))
+
+def _iter_pages(pdf_path, document=None, text_engine=TEXT_ENGINE, ocr=None, page_cache=None):
+    ocr = {} if ocr is None else ocr
+    ocr_batch = max(1, ocr.get('workers', 1)) if ocr is not False else 0
+    
+    with _document_session(pdf_path, document, text_engine, page_cache) as document:
+        if document.is_image:
+            if ocr is not False:
+                yield from _extract_image(pdf_path, ocr)
+            return
         
-        # Styles
-        header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-        header_font = Font(color="FFFFFF", bold=True, size=11)
-        normal_font = Font(size=10)
-        border = Border(
-            left=Side(style='thin'),
-            right=Side(style='thin'),
-            top=Side(style='thin'),
-            bottom=Side(style='thin')
-        )
+        with time_stage('detect_format'):
+            doc_format = detect_format(document)
         
-        current_row = 1
+        scanned = []  # Consecutive text-less pages waiting for OCR
         
-        for table_info in tables:
-            table_data = normalize_table(table_info['data'])
+        for page in document.pages:
+            extracted_table = extract_page(page, doc_format)
+            PAGES_PROCESSED.inc()
             
-            if not table_data:
-                continue
+            needs_ocr = not extracted_table and ocr_batch and not (page.extract_text() or '').strip()
+            if needs_ocr:
+                scanned.append((page.page_number, float(page.page.width)))
+            page.release()
             
-            # Write data
-            for row_idx, row_data in enumerate(table_data):
-                for col_idx, cell_value in enumerate(row_data, start=1):
-                    cell = ws.cell(row=current_row, column=col_idx, value=cell_value)
-                    cell.border = border
-                    
-                    # First row of each page is header
-                    if row_idx == 0:
-                        cell.fill = header_fill
-                        cell.font = header_font
-                        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-                    else:
-                        cell.font = normal_font
-                        cell.alignment = Alignment(vertical='top', wrap_text=True)
-                
-                current_row += 1
+            if scanned and (not needs_ocr or len(scanned) >= ocr_batch):
+                yield from _ocr_page_batch(pdf_path, scanned, ocr)
+                scanned = []
             
-            # Add space between pages
-            current_row += 1
+            if extracted_table:
+                yield {
+                    'page': page.page_number,
+                    'data': extracted_table
+                }
         
-        # Auto-adjust column widths
-        for column in ws.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            
-            for cell in column:
-                try:
-                    if cell.value:
-                        cell_length = len(str(cell.value))
-                        max_length = max(max_length, cell_length)
-                except:
-                    pass
+        if scanned:
+            yield from _ocr_page_batch(pdf_path, scanned, ocr)
+
+def _ocr_page_batch(pdf_path, scanned, ocr):
+    """OCR [(page number, width)] side by side and yield their tables in page order"""
+    try:
+        with time_stage('ocr'):
+            ocr_pages = ocr_pdf_pages(pdf_path, scanned, **ocr)
+    except Exception as e:
+        print(f"OCR error: {str(e)}")
+        return
+    
+    for page_num, width in scanned:
+        extracted_table = extract_page(ocr_pages[page_num])
+        if extracted_table:
+            yield {
+                'page': page_num,
+                'data': extracted_table
+            }
+
+@contextmanager
+def _document_session(pdf_path, document=None, text_engine=TEXT_ENGINE, page_cache=None):
+    """Reuse the caller's document, or open (and later close) a fresh one"""
+    if document is not None:
+        yield document
+        return
+    
+    with PDFDocument(pdf_path, text_engine, page_cache) as document:
+        yield document
+
+def _excel_styles():
+    """Named styles shared by every cell instead of per-cell style objects"""
+    border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    
+    header_style = NamedStyle(name='Statement Header')
+    header_style.fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_style.font = Font(color="FFFFFF", bold=True, size=11)
+    header_style.border = border
+    header_style.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+    
+    normal_style = NamedStyle(name='Statement Row')
+    normal_style.font = Font(size=10)
+    normal_style.border = border
+    normal_style.alignment = Alignment(vertical='top', wrap_text=True)
+    
+    date_style = NamedStyle(name='Statement Date', number_format='dd mmm yyyy')
+    date_style.font = Font(size=10)
+    date_style.border = border
+    date_style.alignment = Alignment(vertical='top')
+    
+    amount_style = NamedStyle(name='Statement Amount', number_format='#,##0.00')
+    amount_style.font = Font(size=10)
+    amount_style.border = border
+    amount_style.alignment = Alignment(vertical='top')
+    
+    return header_style, {TEXT: normal_style, DATE: date_style, AMOUNT: amount_style}
+
+def _column_widths(tables):
+    """Widest value per column, measured on the tables' columns before any cell exists"""
+    max_lengths = []
+    for table_info in tables:
+        for col_idx, width in enumerate(table_info['data'].display_widths()):
+            if col_idx >= len(max_lengths):
+                max_lengths.append(0)
+            max_lengths[col_idx] = max(max_lengths[col_idx], width)
+    
+    return [min(max(max_length + 2, 12), 60) for max_length in max_lengths]
+
+def _write_sheet(wb, title, tables, header_style, row_styles):
+    """Write tables to a new sheet; tables may be a generator, which is consumed once
+    
+    Write-only sheets emit column widths before the first row, so a
+    list of tables is measured in full while a generator is measured on
+    its first table only (cells wrap beyond that).
+    """
+    ws = wb.create_sheet(title)
+    
+    if not isinstance(tables, list):
+        tables = iter(tables)
+        first = next(tables, None)
+        measured = [first] if first is not None else []
+        tables = chain(measured, tables)
+    else:
+        measured = tables
+    
+    for col_idx, width in enumerate(_column_widths(measured), start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = width
+    
+    wrote_table = False
+    
+    for table_info in tables:
+        table_data = table_info['data']
+        
+        if not table_data:
+            continue
+        
+        # A page continuing the previous table goes straight under it
+        if not table_info.get('continued'):
+            # Add space between tables
+            if wrote_table:
+                ws.append([])
             
-            adjusted_width = min(max(max_length + 2, 12), 60)
-            ws.column_dimensions[column_letter].width = adjusted_width
+            cells = []
+            for name in table_data.header:
+                cell = WriteOnlyCell(ws, value=name)
+                cell.style = header_style.name
+                cells.append(cell)
+            ws.append(cells)
+        wrote_table = True
+        
+        # Dates and amounts go in as date and number cells, styled per column kind
+        styles = [row_styles[kind].name for kind in table_data.kinds]
+        for row_data in table_data:
+            cells = []
+            for value, style in zip(row_data, styles):
+                cell = WriteOnlyCell(ws, value=value)
+                cell.style = style
+                cells.append(cell)
+            ws.append(cells)
+
+def create_excel_workbook(sheets, output_path):
+    """Write [(sheet title, tables)] as one formatted workbook
+    
+    Uses openpyxl's write-only mode so rows are streamed to disk as they
+    are emitted and memory stays flat regardless of row count.
+    """
+    try:
+        wb = Workbook(write_only=True)
+        
+        header_style, row_styles = _excel_styles()
+        wb.add_named_style(header_style)
+        for style in row_styles.values():
+            wb.add_named_style(style)
+        
+        for title, tables in sheets:
+            _write_sheet(wb, title, tables, header_style, row_styles)
         
         wb.save(output_path)
         return True
@@ -273,26 +745,163 @@ def create_excel_from_tables(tables, output_path):
         print(f"Excel creation error: {str(e)}")
         return False
 
-def convert_pdf_to_excel(pdf_path, output_path):
-    """Main conversion function"""
+def create_excel_from_tables(tables, output_path):
+    """Create formatted Excel file"""
+    return create_excel_workbook([("Transactions", tables)], output_path)
+
+# Characters Excel refuses in sheet titles, and its title length limit
+SHEET_TITLE_RE = re.compile(r'[\\/*?:\[\]]')
+SHEET_TITLE_MAX = 31
+
+def sheet_titles(filenames):
+    """Unique, Excel-safe sheet titles from statement file names"""
+    titles = []
+    for filename in filenames:
+        base = SHEET_TITLE_RE.sub('_', os.path.splitext(filename)[0]).strip("' ") or 'Statement'
+        title, suffix = base[:SHEET_TITLE_MAX], 2
+        while title.lower() in (existing.lower() for existing in titles):
+            tag = f" ({suffix})"
+            title = base[:SHEET_TITLE_MAX - len(tag)] + tag
+            suffix += 1
+        titles.append(title)
+    return titles
+
+# File outputs: format -> (metrics stage, label, writer(tables, output_path))
+FILE_WRITERS = {
+    'xlsx': ('excel_write', 'Excel', create_excel_from_tables),
+    'parquet': ('parquet_write', 'Parquet', write_parquet),
+}
+
+def convert_pdf_to_excel(pdf_path, output_path, document=None, workers=1, parallel_min_pages=PARALLEL_MIN_PAGES,
+                         text_engine=TEXT_ENGINE, ocr=None, output_format='xlsx', page_cache=None):
+    """Main conversion function
+    
+    Pass an already opened PDFDocument to reuse its page count and
+    per-page extraction cache instead of reopening the file.
+    output_format picks the file writer from FILE_WRITERS.
+    
+    Unless the document is sharded across the process pool, pages are
+    streamed from iter_extracted_pages straight into the writer, so
+    memory does not grow with page count.
+    """
+    total_rows = 0
+    
+    def counted(tables):
+        nonlocal total_rows
+        for table_info in tables:
+            total_rows += len(table_info['data'])
+            yield table_info
+    
     try:
-        pages = count_pdf_pages(pdf_path)
-        if pages == 0:
-            return False, 0, "Could not read PDF file"
+        stage, label, writer = FILE_WRITERS[output_format]
         
-        tables = extract_data_from_pdf(pdf_path)
+        with _document_session(pdf_path, document, text_engine, page_cache) as document:
+            pages = document.page_count
+            if pages == 0:
+                return False, 0, "Could not read PDF file"
+            
+            if workers > 1 and pages >= parallel_min_pages:
+                with time_stage('extract'):
+                    tables = extract_data_from_pdf(pdf_path, document, workers, parallel_min_pages, ocr=ocr,
+                                                   page_cache=page_cache)
+                if not tables:
+                    return False, pages, "No transaction data found in PDF"
+                total_rows = sum(len(table['data']) for table in tables)
+                with time_stage(stage):
+                    success = writer(tables, output_path)
+            else:
+                with time_stage('extract_stream'):
+                    success = writer(counted(iter_extracted_pages(pdf_path, document, ocr=ocr)), output_path)
         
-        if not tables:
+        if not total_rows:
             return False, pages, "No transaction data found in PDF"
         
-        success = create_excel_from_tables(tables, output_path)
-        
         if success:
-            total_rows = sum(len(table['data']) - 1 for table in tables)  # Exclude headers
             return True, pages, f"Converted {pages} page(s) with {total_rows} transaction(s)"
         else:
-            return False, pages, "Error creating Excel file"
+            return False, pages, f"Error creating {label} file"
     
     except Exception as e:
         print(f"Conversion error: {str(e)}")
         return False, 0, f"Error: {str(e)}"
+
+def convert_pdf_to_stream(pdf_path, output_format, text_engine=TEXT_ENGINE, ocr=None, page_cache=None):
+    """(chunk, rows so far) pairs of a streamed CSV/NDJSON conversion, one chunk per page"""
+    rows = 0
+    
+    def counted(tables):
+        nonlocal rows
+        for table_info in tables:
+            rows += len(table_info['data'])
+            yield table_info
+    
+    tables = iter_extracted_pages(pdf_path, text_engine=text_engine, ocr=ocr, page_cache=page_cache)
+    for chunk in STREAM_WRITERS[output_format](counted(tables)):
+        yield chunk, rows
+
+def _extract_statement(pdf_path, text_engine=TEXT_ENGINE, ocr=None, page_cache=None):
+    """Pool worker: extract one statement of a batch"""
+    return extract_data_from_pdf(pdf_path, text_engine=text_engine, ocr=ocr, page_cache=page_cache)
+
+def _write_workbook_zip(sheets, output_path):
+    """One workbook per statement, bundled into a ZIP"""
+    try:
+        with tempfile.TemporaryDirectory() as workdir, zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as bundle:
+            for title, tables in sheets:
+                workbook_path = os.path.join(workdir, f"{title}.xlsx")
+                if not create_excel_from_tables(tables, workbook_path):
+                    return False
+                bundle.write(workbook_path, f"{title}.xlsx")
+        return True
+    
+    except Exception as e:
+        print(f"ZIP creation error: {str(e)}")
+        return False
+
+def convert_batch(statements, output_path, output_format='xlsx', workers=1, text_engine=TEXT_ENGINE, ocr=None,
+                  page_cache=None):
+    """Convert several statements into one workbook (a sheet each) or a ZIP of workbooks
+    
+    statements is [(name, path, pages)]. With workers > 1 the statements
+    are extracted side by side on the extraction pool. A statement with
+    no transactions is left out rather than failing the whole batch.
+    Returns (success, pages converted, message).
+    """
+    try:
+        with time_stage('extract'):
+            if workers > 1 and len(statements) > 1:
+                pool = _get_extraction_pool(workers)
+                futures = [pool.submit(_extract_statement, path, text_engine, ocr, page_cache)
+                           for name, path, pages in statements]
+                results = [future.result() for future in futures]
+            else:
+                results = [_extract_statement(path, text_engine, ocr, page_cache) for name, path, pages in statements]
+        
+        converted = [(name, pages, tables) for (name, path, pages), tables in zip(statements, results) if tables]
+        skipped = [name for (name, path, pages), tables in zip(statements, results) if not tables]
+        
+        if not converted:
+            return False, 0, "No transaction data found in any statement"
+        
+        sheets = list(zip(sheet_titles(name for name, pages, tables in converted),
+                          (tables for name, pages, tables in converted)))
+        
+        with time_stage('excel_write'):
+            if output_format == 'zip':
+                success = _write_workbook_zip(sheets, output_path)
+            else:
+                success = create_excel_workbook(sheets, output_path)
+        
+        if not success:
+            return False, 0, "Error creating Excel file"
+        
+        pages = sum(pages for name, pages, tables in converted)
+        total_rows = sum(len(table['data']) for name, pages, tables in converted for table in tables)
+        message = f"Converted {len(converted)} statement(s), {pages} page(s) with {total_rows} transaction(s)"
+        if skipped:
+            message += f"; no transactions found in {', '.join(skipped)}"
+        return True, pages, message
+    
+    except Exception as e:
+        print(f"Batch conversion error: {str(e)}")
+        return False, 0, f"Error: {str(e)}"
@@ -0,0 +1,134 @@
+import os
+import shutil
+import threading
+from utils.metrics import RESULT_CACHE_LOOKUPS
+
+# evict() trims the folder to this share of max_bytes, so the next scan is
+# only needed after that much has been written again
+EVICT_LOW_WATER = 0.9
+
+class ResultCache:
+    """Content-addressed cache of converted workbooks
+    
+    Entries are keyed on the SHA-256 of the uploaded bytes plus the
+    converter version, so a converter change never serves stale output.
+    Reads bump the entry's mtime, which doubles as the LRU clock; once
+    the folder exceeds max_bytes the least recently used entries go.
+    read()/write() store small payloads (e.g. OCR output) the same way.
+    
+    The folder is scanned only when the size seen at the last scan plus
+    this instance's writes since passes max_bytes, not on every write;
+    writes from other processes are picked up at that scan. Every entry
+    in the folder counts toward max_bytes, whatever its suffix, so caches
+    sharing a folder share one budget.
+    """
+    
+    def __init__(self, folder, max_bytes, version, suffix='.xlsx'):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.version = version
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._estimated_bytes = None  # folder size at the last evict() plus writes since
+        os.makedirs(folder, exist_ok=True)
+    
+    def _entry_path(self, content_hash):
+        return os.path.join(self.folder, f"{content_hash}-{self.version}{self.suffix}")
+    
+    def get(self, content_hash, output_path):
+        """Place the cached workbook at output_path; False on a miss"""
+        entry_path = self._entry_path(content_hash)
+        
+        try:
+            _copy_into_place(entry_path, output_path)
+            os.utime(entry_path)
+        except FileNotFoundError:
+            RESULT_CACHE_LOOKUPS.labels(result='miss').inc()
+            return False
+        
+        RESULT_CACHE_LOOKUPS.labels(result='hit').inc()
+        return True
+    
+    def read(self, content_hash):
+        """Cached payload bytes, or None on a miss"""
+        entry_path = self._entry_path(content_hash)
+        
+        try:
+            with open(entry_path, 'rb') as entry:
+                data = entry.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            return None
+        
+        return data
+    
+    def write(self, content_hash, data):
+        entry_path = self._entry_path(content_hash)
+        temp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        
+        try:
+            with open(temp_path, 'wb') as entry:
+                entry.write(data)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            print(f"Result cache store error: {str(e)}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        
+        self._stored(len(data))
+    
+    def put(self, content_hash, output_path):
+        try:
+            size = os.path.getsize(output_path)
+            _copy_into_place(output_path, self._entry_path(content_hash))
+        except OSError as e:
+            print(f"Result cache store error: {str(e)}")
+            return
+        
+        self._stored(size)
+    
+    def _stored(self, size):
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += size
+            due = self._estimated_bytes is None or self._estimated_bytes > self.max_bytes
+        if due:
+            self.evict()
+    
+    def evict(self):
+        """Drop least recently used entries until the folder is back under the low-water mark"""
+        entries = []
+        total = 0
+        
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        
+        entries.sort()
+        if total > self.max_bytes:
+            for mtime, size, path in entries:
+                if total <= self.max_bytes * EVICT_LOW_WATER:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        
+        with self._lock:
+            self._estimated_bytes = total
+
+def _copy_into_place(source, destination):
+    # A copy, not a hard link, so a rewritten output never changes its cache
+    # entry; renamed over whatever is already at destination
+    temp_path = f"{destination}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from models import db, Conversion
+
+# The size budget never removes files this recent, so a workbook that is
+# still being written or has just been handed out survives the sweep
+MIN_AGE_SECONDS = 300
+
+class RetentionSweeper:
+    """Background expiry of converted files
+    
+    Every interval seconds, files in CONVERTED_FOLDER older than max_age
+    are deleted, then the oldest remaining ones until the folder fits
+    max_bytes. Conversions whose file is gone are marked 'expired'.
+    Cache subfolders manage their own size and are left alone.
+    """
+    
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._stop = threading.Event()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.app = app
+        self.folder = app.config['CONVERTED_FOLDER']
+        self.max_age = app.config['RETENTION_MAX_AGE_HOURS'] * 3600
+        self.max_bytes = app.config['RETENTION_MAX_BYTES']
+        self.interval = app.config['RETENTION_SWEEP_INTERVAL']
+    
+    def start(self):
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(target=self._loop, name='retention-sweeper', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep error: {str(e)}")
+    
+    def _files(self):
+        """(mtime, size, name) of the converted files, oldest first"""
+        files = []
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.name))
+        return sorted(files)
+    
+    def sweep(self, now=None):
+        """Run one pass; returns the names of the files removed"""
+        now = time.time() if now is None else now
+        files = self._files()
+        total = sum(size for mtime, size, name in files)
+        expired = []
+        
+        for mtime, size, name in files:
+            too_old = now - mtime > self.max_age
+            over_budget = total > self.max_bytes and now - mtime > MIN_AGE_SECONDS
+            if not (too_old or over_budget):
+                continue
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass  # Already swept by another worker
+            total -= size
+            expired.append(name)
+        
+        if expired:
+            self._mark_expired(expired)
+        return expired
+    
+    def _mark_expired(self, filenames):
+        with self.app.app_context():
+            try:
+                # Chunked to stay under SQLite's bound-parameter limit
+                for start in range(0, len(filenames), 500):
+                    db.session.execute(
+                        db.update(Conversion)
+                        .where(Conversion.converted_filename.in_(filenames[start:start + 500]),
+                               Conversion.status == 'completed')
+                        .values(status='expired')
+                        .execution_options(synchronize_session=False)
+                    )
+                db.session.commit()
+            finally:
+                db.session.remove()
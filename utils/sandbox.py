@@ -0,0 +1,293 @@
+import atexit
+import math
+import multiprocessing
+import os
+import resource
+import signal
+import threading
+import time
+from utils import pdf_converter
+from utils.metrics import SANDBOX_FAILURES, mark_process_dead
+
+# Extraction pool pids a worker can record, for clean-up once it is stopped
+POOL_PID_SLOTS = 32
+
+class SandboxError(Exception):
+    """A sandboxed conversion was stopped
+    
+    reason is 'timeout', 'cpu', 'memory', 'crash' or 'error'; page is the
+    page being extracted at the time and pages_done the pages finished
+    before it (both 0 when no page had started).
+    """
+    
+    def __init__(self, reason, message, page=0, pages_done=0):
+        super().__init__(message)
+        self.reason = reason
+        self.page = page
+        self.pages_done = pages_done
+
+class SandboxPool:
+    """Warm child processes that run conversions under resource limits
+    
+    A malformed PDF can keep pdfminer busy for minutes or grow without
+    bound; inside a web worker that would stall everyone it serves. Each
+    task here runs in a worker process with an address-space cap
+    (RLIMIT_AS), a CPU-time cap (RLIMIT_CPU, renewed per task) and a
+    wall-clock deadline enforced by the parent, which kills the worker
+    when it passes. Any of these, or a crash, raises SandboxError saying
+    how far through the document the conversion got.
+    
+    Workers are forked from a forkserver, a single-threaded process that
+    has imported the converter once. Forking the web worker itself would
+    copy any lock another of its threads happened to hold, such as
+    prometheus_client's, and the worker would hang on it. Each worker is
+    reused for max_tasks tasks, so isolation adds neither fork nor import
+    time per conversion. A worker's extraction pool lives as long as the
+    worker; the CPU cap applies to the worker itself, while pool
+    processes are bounded by the deadline (stopping a worker stops its
+    pool too). At most size tasks run at once; further callers wait for a
+    free worker. A limit of 0 disables it.
+    """
+    
+    def __init__(self, size=2, memory_mb=0, cpu_seconds=0, timeout=0, max_tasks=100):
+        self.size = size
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self._context = multiprocessing.get_context('forkserver')
+        self._context.set_forkserver_preload(['utils.pdf_converter'])
+        self._lock = threading.Lock()
+        self._reset()
+        atexit.register(self.shutdown)
+    
+    def _reset(self):
+        self._pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle = []
+        self._workers = set()
+    
+    def run(self, func, *args, **kwargs):
+        """func(*args, **kwargs) in a worker; returns its result or raises SandboxError"""
+        results = self._call(func, args, kwargs, streaming=False)
+        try:
+            return next(results)
+        finally:
+            results.close()
+    
+    def stream(self, func, *args, **kwargs):
+        """Items of the generator func(*args, **kwargs), passed on as the worker yields them
+        
+        The deadline covers the whole stream. Closing the stream early
+        kills the worker, since its task cannot be interrupted otherwise.
+        """
+        yield from self._call(func, args, kwargs, streaming=True)
+    
+    def _call(self, func, args, kwargs, streaming):
+        worker = self._acquire()
+        finished = False
+        
+        try:
+            deadline = time.monotonic() + self.timeout if self.timeout else None
+            worker.send((func, args, kwargs, streaming, self.cpu_seconds))
+            
+            while True:
+                kind, value = self._receive(worker, deadline)
+                if kind == 'item':
+                    yield value
+                elif kind == 'done':
+                    finished = True
+                    if not streaming:
+                        yield value
+                    return
+                elif kind == 'error':
+                    finished = True
+                    raise self._failure(worker, 'error', value)
+                else:
+                    raise self._failure(worker, kind)
+        
+        finally:
+            self._release(worker, finished)
+    
+    def _receive(self, worker, deadline):
+        remaining = None if deadline is None else max(0, deadline - time.monotonic())
+        if not worker.conn.poll(remaining):
+            worker.stop()
+            raise self._failure(worker, 'timeout')
+        
+        try:
+            return worker.conn.recv()
+        except (EOFError, OSError):
+            worker.process.join()
+            exitcode = worker.process.exitcode
+            raise self._failure(worker, 'cpu' if exitcode == -signal.SIGXCPU else 'crash', exitcode)
+    
+    def _failure(self, worker, reason, detail=None):
+        SANDBOX_FAILURES.labels(reason=reason).inc()
+        page, pages_started = worker.progress
+        
+        if reason == 'timeout':
+            message = f"Conversion stopped: exceeded the {self.timeout}s time limit"
+        elif reason == 'cpu':
+            message = f"Conversion stopped: exceeded the {self.cpu_seconds}s CPU limit"
+        elif reason == 'memory':
+            message = f"Conversion stopped: exceeded the {self.memory_mb} MB memory limit"
+        elif reason == 'error':
+            message = f"Conversion failed: {detail}"
+        else:
+            message = f"Conversion stopped: worker exited unexpectedly (exit code {detail})"
+        
+        if page:
+            message += f" on page {page}, after {pages_started - 1} page(s) were extracted"
+        return SandboxError(reason, message, page, max(0, pages_started - 1))
+    
+    def _acquire(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked (e.g. by gunicorn); the parent's workers are not ours
+                self._reset()
+            slots = self._slots
+        
+        slots.acquire()
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.process.is_alive():
+                    return worker
+                self._workers.discard(worker)
+        
+        try:
+            worker = _Worker(self._context, self.memory_mb)
+        except Exception:
+            slots.release()
+            raise
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+    
+    def _release(self, worker, reusable):
+        worker.tasks += 1
+        with self._lock:
+            if reusable and worker.tasks < self.max_tasks:
+                self._idle.append(worker)
+                worker = None
+            else:
+                self._workers.discard(worker)
+        
+        if worker is not None:
+            worker.stop()
+        self._slots.release()
+    
+    def shutdown(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            workers, self._workers, self._idle = self._workers, set(), []
+        for worker in workers:
+            worker.stop()
+
+class _Worker:
+    def __init__(self, context, memory_mb):
+        self.conn, child_conn = context.Pipe()
+        # Page being extracted, pages started; written by the worker
+        self._progress = context.Array('i', 2, lock=False)
+        # Extraction pool processes started by the worker; written by them
+        self._pool_pids = context.Array('i', POOL_PID_SLOTS)
+        # Not a daemon, so conversions may still use the extraction pool
+        self.process = context.Process(target=_serve, args=(child_conn, self._progress, self._pool_pids, memory_mb),
+                                       name='conversion-sandbox')
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+    
+    @property
+    def progress(self):
+        return self._progress[0], self._progress[1]
+    
+    def send(self, task):
+        self.conn.send(task)
+    
+    def stop(self):
+        # The worker leads its own process group (see _serve), so this also
+        # reaches the extraction pool processes it forked
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        if self.process.is_alive():
+            self.process.kill()  # Stopped before it could call setsid()
+        self.process.join()
+        self.conn.close()
+        for pid in [self.process.pid, *filter(None, self._pool_pids)]:
+            mark_process_dead(pid)
+
+# The worker's pool_pids, inherited by the pool processes it forks
+_pool_pids = None
+
+def _start_pool_process():
+    """Extraction pool initializer inside a worker"""
+    # Pool processes outlive tasks, so a CPU limit inherited from one task
+    # would cut a later one short; the deadline bounds them instead
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+    
+    if _pool_pids is not None:
+        with _pool_pids.get_lock():
+            for slot, pid in enumerate(_pool_pids):
+                if not pid:
+                    _pool_pids[slot] = os.getpid()
+                    break
+
+def _serve(conn, progress, pool_pids, memory_mb):
+    """Worker process: run tasks from conn until it is closed"""
+    global _pool_pids
+    # A session of its own, so stopping the worker takes down everything it forked
+    os.setsid()
+    # Not the web server's handlers; the parent stops workers itself
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    
+    def record_page(page_number):
+        progress[0] = page_number
+        progress[1] += 1
+    
+    _pool_pids = pool_pids
+    pdf_converter.page_progress = record_page
+    pdf_converter.extraction_pool_initializer = _start_pool_process
+    
+    while True:
+        try:
+            func, args, kwargs, streaming, cpu_seconds = conn.recv()
+        except EOFError:
+            return
+        
+        progress[0] = progress[1] = 0
+        _limit_cpu(cpu_seconds)
+        
+        try:
+            if streaming:
+                for item in func(*args, **kwargs):
+                    conn.send(('item', item))
+                conn.send(('done', None))
+            else:
+                conn.send(('done', func(*args, **kwargs)))
+        except MemoryError:
+            conn.send(('memory', None))
+            return
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {str(e)}"))
+
+def _limit_cpu(seconds):
+    """Give the next task seconds of CPU on top of what this worker has used so far"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = math.ceil(usage.ru_utime + usage.ru_stime) + seconds
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
@@ -0,0 +1,92 @@
+from pdfminer.pdfdevice import PDFDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+from pdfminer.utils import mult_matrix, apply_matrix_pt
+
+# Same tolerances pdfplumber uses to group chars into lines and words
+Y_TOLERANCE = 3
+X_TOLERANCE = 3
+
+class TextRunDevice(PDFDevice):
+    """pdfminer device that records decoded text runs and their origins
+    
+    Unlike pdfplumber's extract_text() it never builds per-character
+    layout objects; each Tj/TJ string becomes a single run, which is all
+    the text-layout parsers (e.g. PhonePe) need.
+    """
+    
+    def begin_page(self, page, ctm):
+        self.ctm = ctm
+        self.runs = []
+    
+    def render_string(self, textstate, seq, ncs, graphicstate):
+        font = textstate.font
+        matrix = mult_matrix(textstate.matrix, self.ctm)
+        x, y = apply_matrix_pt(matrix, textstate.linematrix)
+        
+        fontsize = textstate.fontsize
+        scaling = textstate.scaling * .01
+        charspace = textstate.charspace * scaling
+        wordspace = textstate.wordspace * scaling if not font.is_multibyte() else 0
+        
+        chars = []
+        advance = 0
+        for obj in seq:
+            if isinstance(obj, bytes):
+                for cid in font.decode(obj):
+                    try:
+                        chars.append(font.to_unichr(cid))
+                    except PDFUnicodeNotDefined:
+                        chars.append(f"(cid:{cid})")
+                    advance += font.char_width(cid) * fontsize * scaling + charspace
+                    if cid == 32:
+                        advance += wordspace
+            else:
+                advance -= obj * .001 * fontsize * scaling
+        
+        # Advance the text position so consecutive strings land after each other
+        line_x, line_y = textstate.linematrix
+        textstate.linematrix = (line_x + advance, line_y)
+        
+        text = ''.join(chars)
+        if text.strip():
+            self.runs.append((-y, x, len(self.runs), text, x + advance * matrix[0]))
+
+def _join_line(runs):
+    runs.sort()
+    line = ''
+    end = None
+    
+    for x, order, text, run_end in runs:
+        if end is not None and x - end > X_TOLERANCE and not line.endswith(' ') and not text.startswith(' '):
+            line += ' '
+        line += text
+        end = run_end
+    
+    return line.strip()
+
+def _runs_to_text(runs):
+    runs.sort()
+    lines = []
+    current = []
+    line_top = None
+    
+    for top, x, order, text, run_end in runs:
+        if current and top - line_top > Y_TOLERANCE:
+            lines.append(_join_line(current))
+            current = []
+        if not current:
+            line_top = top
+        current.append((x, order, text, run_end))
+    
+    if current:
+        lines.append(_join_line(current))
+    
+    return '\n'.join(lines)
+
+def extract_text_fast(page_obj, resource_manager=None):
+    """Plain text of a pdfminer page, one line per visual row"""
+    resource_manager = resource_manager or PDFResourceManager(caching=True)
+    device = TextRunDevice(resource_manager)
+    PDFPageInterpreter(resource_manager, device).process_page(page_obj)
+    return _runs_to_text(device.runs)
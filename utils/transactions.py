@@ -0,0 +1,325 @@
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime
+from decimal import Decimal
+
+# Column kinds, picked from the header text
+DATE = 'date'
+AMOUNT = 'amount'
+TEXT = 'text'
+
+DATE_HEADER_RE = re.compile(r'\bdate\b', re.IGNORECASE)
+AMOUNT_HEADER_RE = re.compile(r'\b(debit|credit|balance|amount|withdrawals?|deposits?)\b', re.IGNORECASE)
+
+# Blank or unparseable typed cells; no date has ordinal 0
+MISSING_DATE = 0
+MISSING_AMOUNT = -2 ** 63
+
+# Formats seen on Indian statements, most common first
+DATE_FORMATS = (
+    '%d %b %Y',   # 01 Jan 2024 (SBI)
+    '%b %d, %Y',  # Sep 07, 2024 (PhonePe)
+    '%d/%m/%Y',
+    '%d-%m-%Y',
+    '%d-%b-%Y',
+    '%Y-%m-%d',
+    '%d %B %Y',
+    '%d %b %y',
+    '%d/%m/%y',
+    '%d-%m-%y',
+    '%d-%b-%y',
+)
+
+AMOUNT_RE = re.compile(r'(\d+)(?:\.(\d{1,2}))?')
+AMOUNT_NOISE = str.maketrans('', '', '₹,  ')
+
+def column_kind(name):
+    name = name or ''
+    if DATE_HEADER_RE.search(name):
+        return DATE
+    if AMOUNT_HEADER_RE.search(name):
+        return AMOUNT
+    return TEXT
+
+def _parse_date(value):
+    value = ' '.join(value.split())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).toordinal()
+        except ValueError:
+            pass
+    return MISSING_DATE
+
+def _parse_amount(value):
+    value = value.translate(AMOUNT_NOISE).upper()
+    if value.startswith('RS.'):
+        value = value[3:]
+    
+    sign = 1
+    if value.endswith('DR'):
+        sign, value = -1, value[:-2]
+    elif value.endswith('CR'):
+        value = value[:-2]
+    if value.startswith('(') and value.endswith(')'):
+        sign, value = -sign, value[1:-1]
+    if value.startswith('-'):
+        sign, value = -sign, value[1:]
+    elif value.startswith('+'):
+        value = value[1:]
+    
+    match = AMOUNT_RE.fullmatch(value)
+    if not match:
+        return MISSING_AMOUNT
+    whole, fraction = match.groups()
+    return sign * (int(whole) * 100 + int((fraction or '').ljust(2, '0')))
+
+def _parse_column(values, parse, missing, typecode):
+    """Parse a whole column; each distinct string is parsed only once"""
+    parsed = {'': missing}
+    column = array(typecode)
+    for value in values:
+        number = parsed.get(value)
+        if number is None:
+            number = parsed[value] = parse(value)
+        column.append(number)
+    return column
+
+def parse_dates(values):
+    """array('i') of date ordinals; MISSING_DATE where blank or unparseable"""
+    return _parse_column(values, _parse_date, MISSING_DATE, 'i')
+
+def parse_amounts(values):
+    """array('q') of amounts in paise from '₹1,200.50' style strings; MISSING_AMOUNT where blank or unparseable"""
+    return _parse_column(values, _parse_amount, MISSING_AMOUNT, 'q')
+
+PARSERS = {DATE: (parse_dates, MISSING_DATE), AMOUNT: (parse_amounts, MISSING_AMOUNT)}
+
+def format_amount(paise, grouping=False):
+    """'1200.50' (or '1,200.50' with grouping) from paise"""
+    rupees, remainder = divmod(abs(paise), 100)
+    rupees = f"{rupees:,}" if grouping else str(rupees)
+    return f"{'-' if paise < 0 else ''}{rupees}.{remainder:02d}"
+
+class TransactionTable:
+    """One page of transactions, stored by column
+    
+    Date columns hold ordinals in array('i'), amount columns hold paise in
+    array('q') and text columns hold interned strings, so a row costs a
+    few machine words instead of a list of str. Column kinds come from
+    the header. A typed cell that does not parse is kept as its original
+    text in raw, so nothing from the statement is lost.
+    """
+    
+    def __init__(self, header, rows=(), width=0):
+        header = [str(name).strip() if name else '' for name in header]
+        self.header = header + [''] * (width - len(header))
+        self.kinds = [column_kind(name) for name in self.header]
+        self.columns = [array('i') if kind == DATE else array('q') if kind == AMOUNT else []
+                        for kind in self.kinds]
+        self.raw = {}  # (col_idx, row_idx) -> original text of an unparsed typed cell
+        self._length = 0
+        self.extend(rows)
+    
+    @classmethod
+    def from_rows(cls, rows):
+        """Table from string rows, the first of which is the header"""
+        return cls(rows[0], rows[1:], max(len(row) for row in rows))
+    
+    @property
+    def width(self):
+        return len(self.header)
+    
+    def __len__(self):
+        return self._length
+    
+    def extend(self, rows):
+        """Append string rows, parsing one column at a time; longer rows are cut to the header"""
+        rows = rows if isinstance(rows, (list, tuple)) else list(rows)
+        if not rows:
+            return
+        
+        start = self._length
+        for col_idx, (kind, column) in enumerate(zip(self.kinds, self.columns)):
+            values = [row[col_idx] or '' if col_idx < len(row) else '' for row in rows]
+            if kind == TEXT:
+                column.extend(sys.intern(value) for value in values)
+                continue
+            
+            parse, missing = PARSERS[kind]
+            parsed = parse(values)
+            column.extend(parsed)
+            for row_idx, (value, number) in enumerate(zip(values, parsed), start=start):
+                if number == missing and value:
+                    self.raw[(col_idx, row_idx)] = value
+        
+        self._length += len(rows)
+    
+    def append(self, row):
+        self.extend([row])
+    
+    def value(self, col_idx, row_idx):
+        """Typed cell: date, Decimal, str, or None when blank"""
+        kind, number = self.kinds[col_idx], self.columns[col_idx][row_idx]
+        if kind == TEXT:
+            return number
+        if (col_idx, row_idx) in self.raw:
+            return self.raw[(col_idx, row_idx)]
+        if kind == DATE:
+            return None if number == MISSING_DATE else date.fromordinal(number)
+        return None if number == MISSING_AMOUNT else Decimal(number).scaleb(-2)
+    
+    def __iter__(self):
+        """Typed rows"""
+        for row_idx in range(self._length):
+            yield [self.value(col_idx, row_idx) for col_idx in range(self.width)]
+    
+    def text(self, col_idx, row_idx):
+        """Cell as text: ISO dates and plain amounts, as written to CSV"""
+        kind, number = self.kinds[col_idx], self.columns[col_idx][row_idx]
+        if kind == TEXT:
+            return number
+        if (col_idx, row_idx) in self.raw:
+            return self.raw[(col_idx, row_idx)]
+        if kind == DATE:
+            return '' if number == MISSING_DATE else date.fromordinal(number).isoformat()
+        return '' if number == MISSING_AMOUNT else format_amount(number)
+    
+    def text_rows(self):
+        for row_idx in range(self._length):
+            yield [self.text(col_idx, row_idx) for col_idx in range(self.width)]
+    
+    def _is_blank_typed(self, col_idx, row_idx):
+        missing = MISSING_DATE if self.kinds[col_idx] == DATE else MISSING_AMOUNT
+        return self.columns[col_idx][row_idx] == missing and (col_idx, row_idx) not in self.raw
+    
+    def is_continuation(self, row_idx):
+        """True for a row that only carries on the previous one's text, like a wrapped description"""
+        typed = [col_idx for col_idx, kind in enumerate(self.kinds) if kind != TEXT]
+        return (bool(typed) and all(self._is_blank_typed(col_idx, row_idx) for col_idx in typed) and
+                any(self.columns[col_idx][row_idx] for col_idx, kind in enumerate(self.kinds) if kind == TEXT))
+    
+    def is_header_row(self, row_idx):
+        return all(self.text(col_idx, row_idx) == name for col_idx, name in enumerate(self.header))
+    
+    def looks_like_data(self, row):
+        """True when row parses as a transaction under this table's columns, i.e. it is not a header"""
+        dates = [cell for kind, cell in zip(self.kinds, row) if kind == DATE and cell]
+        if dates:
+            return all(_parse_date(cell) != MISSING_DATE for cell in dates)
+        amounts = [cell for kind, cell in zip(self.kinds, row) if kind == AMOUNT and cell]
+        return bool(amounts) and all(_parse_amount(cell) != MISSING_AMOUNT for cell in amounts)
+    
+    def continue_row(self, row_idx, other, other_row_idx):
+        """Append the text cells of other's row to this table's row; both share a header"""
+        for col_idx, kind in enumerate(self.kinds):
+            if kind == TEXT and other.columns[col_idx][other_row_idx]:
+                column = self.columns[col_idx]
+                column[row_idx] = sys.intern(' '.join(filter(None, (column[row_idx], other.columns[col_idx][other_row_idx]))))
+    
+    def remove_rows(self, row_indices):
+        removed = sorted(set(row_indices))
+        if not removed:
+            return
+        
+        for column in self.columns:
+            for row_idx in reversed(removed):
+                del column[row_idx]
+        
+        removed_set = set(removed)
+        self.raw = {(col_idx, row_idx - bisect_left(removed, row_idx)): value
+                    for (col_idx, row_idx), value in self.raw.items() if row_idx not in removed_set}
+        self._length -= len(removed)
+    
+    def has_raw(self, col_idx):
+        return any(key[0] == col_idx for key in self.raw)
+    
+    def display_widths(self):
+        """Characters needed per column as shown in the workbook, header included"""
+        widths = []
+        for col_idx, (kind, column) in enumerate(zip(self.kinds, self.columns)):
+            width = len(self.header[col_idx])
+            if kind == TEXT:
+                width = max([width] + [len(value) for value in column])
+            elif kind == DATE:
+                if any(number != MISSING_DATE for number in column):
+                    width = max(width, len('01 Jan 2024'))
+            else:
+                amounts = [number for number in column if number != MISSING_AMOUNT]
+                if amounts:
+                    width = max(width, len(format_amount(max(amounts, key=abs), grouping=True)) + 1)
+            widths.append(width)
+        
+        for (col_idx, row_idx), value in self.raw.items():
+            widths[col_idx] = max(widths[col_idx], len(value))
+        return widths
+    
+    def to_dict(self):
+        """JSON-safe form that from_dict() restores without re-parsing"""
+        return {
+            'header': self.header,
+            'columns': [list(column) for column in self.columns],
+            'raw': [[col_idx, row_idx, value] for (col_idx, row_idx), value in self.raw.items()],
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        table = cls(data['header'])
+        for col_idx, values in enumerate(data['columns']):
+            if table.kinds[col_idx] == TEXT:
+                table.columns[col_idx] = [sys.intern(value) for value in values]
+            else:
+                table.columns[col_idx].extend(values)
+        table.raw = {(col_idx, row_idx): value for col_idx, row_idx, value in data['raw']}
+        table._length = len(data['columns'][0]) if data['columns'] else 0
+        return table
+    
+    def to_rows(self):
+        """Header plus text rows as plain lists"""
+        return [list(self.header)] + list(self.text_rows())
+
+def stitch_pages(tables):
+    """Join per-page tables into one continuous transaction stream
+    
+    Takes and yields {'page', 'data'} dicts in page order. Header rows
+    repeated inside a table are dropped. A page whose table has the
+    previous page's header is marked 'continued', so writers add its rows
+    without a header of their own; a header-less page, whose first row
+    was taken for a header, is re-read under the previous header. Leading
+    rows that only continue the previous page's last transaction (a
+    description split by the page break) are merged into it.
+    
+    Each page is held back until the next one arrives, so at most two
+    pages are in memory.
+    """
+    held = None
+    
+    for table_info in tables:
+        table = table_info['data']
+        table.remove_rows(row_idx for (col_idx, row_idx) in table.raw if table.is_header_row(row_idx))
+        
+        if held is not None:
+            previous = held['data']
+            
+            if (table.header != previous.header and table.width == previous.width and
+                    previous.looks_like_data(table.header)):
+                table = TransactionTable(previous.header, [table.header] + list(table.text_rows()))
+            
+            if table.header == previous.header:
+                leading = 0
+                while leading < len(table) and table.is_continuation(leading):
+                    previous.continue_row(len(previous) - 1, table, leading)
+                    leading += 1
+                table.remove_rows(range(leading))
+                table_info = dict(table_info, data=table, continued=True)
+        
+        if not table:
+            continue
+        
+        if held is not None:
+            yield held
+        held = table_info
+    
+    if held is not None:
+        yield held
@@ -0,0 +1,127 @@
+import os
+import zipfile
+from PyPDF2 import PdfReader
+from werkzeug.utils import secure_filename
+from utils.ocr import is_image_file, image_page_count
+from utils.metrics import time_stage
+
+# Leading bytes each allowed extension must start with
+FILE_SIGNATURES = {
+    'pdf': (b'%PDF-',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'zip': (b'PK\x03\x04',),
+}
+
+# Readers accept the PDF header anywhere in the first 1024 bytes
+PDF_HEADER_WINDOW = 1024
+
+def check_signature(filename, head):
+    """Error message if the first bytes of an upload don't match its extension, else None"""
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    signatures = FILE_SIGNATURES.get(extension, ())
+    
+    if extension == 'pdf':
+        matches = signatures[0] in head[:PDF_HEADER_WINDOW]
+    else:
+        matches = any(head.startswith(signature) for signature in signatures)
+    
+    if not matches:
+        return f"File is not a valid {extension.upper() or 'PDF'} file"
+    return None
+
+def pdf_page_count(pdf_path):
+    """Page count from walking the page tree; returns (pages, error)
+    
+    PyPDF2 reads the xref table and resolves objects lazily, so this
+    touches only the page tree nodes instead of running pdfminer over the
+    document the way pdfplumber does on open. The /Count of the tree root
+    is not trusted: the uploader controls it, and credits and the guest
+    page limit are based on this number.
+    """
+    try:
+        with time_stage('count_pages'):
+            reader = PdfReader(pdf_path, strict=False)
+            if reader.is_encrypted:
+                return 0, "Password-protected PDFs are not supported. Please upload an unlocked copy"
+            pages = len(reader.pages)
+        
+        return pages, None
+    
+    except Exception as e:
+        print(f"Error counting pages: {str(e)}")
+        return 0, "Could not read PDF file"
+
+def inspect_upload(path):
+    """Validate a saved upload without parsing its content; returns (pages, error)"""
+    if is_image_file(path):
+        pages = image_page_count(path)
+        return pages, None if pages else "Could not read image file"
+    
+    pages, error = pdf_page_count(path)
+    if not error and pages == 0:
+        error = "Could not read PDF file"
+    return pages, error
+
+def batch_file_name(position, filename):
+    """Name a batch statement is saved under; the position keeps the upload order"""
+    return f"{position:02d}_{filename}"
+
+def batch_file_position(saved_name):
+    return int(saved_name.split('_', 1)[0])
+
+def extract_zip_statements(zip_path, folder, allowed_extensions, max_files, max_bytes, first_position=1,
+                           chunk_size=64 * 1024):
+    """Unpack the statements in a ZIP into folder; returns (saved file names, error)
+    
+    Members are saved under batch_file_name(), numbered from
+    first_position so they follow the batch's files so far. Members are
+    checked against the declared and the actual uncompressed size, so a
+    ZIP bomb is cut off after max_bytes. Directories, hidden and
+    unsupported files are skipped.
+    """
+    saved = []
+    total = 0
+    
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            members = sorted((member for member in archive.infolist() if not member.is_dir()),
+                             key=lambda member: member.filename)
+            
+            for member in members:
+                name = secure_filename(os.path.basename(member.filename))
+                if not name or name.startswith('.') or member.filename.startswith('__MACOSX/'):
+                    continue
+                if name.rsplit('.', 1)[-1].lower() not in allowed_extensions:
+                    continue
+                if len(saved) >= max_files:
+                    return saved, f"A batch can contain at most {max_files} statements"
+                
+                total += member.file_size
+                if total > max_bytes:
+                    return saved, "ZIP contents are too large"
+                
+                target = batch_file_name(first_position + len(saved), name)
+                with archive.open(member) as source, open(os.path.join(folder, target), 'wb') as destination:
+                    written = 0
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        if written == 0:
+                            error = check_signature(name, chunk)
+                            if error:
+                                return saved, f"{member.filename}: {error}"
+                        written += len(chunk)
+                        if written > member.file_size:
+                            return saved, "ZIP contents are too large"
+                        destination.write(chunk)
+                saved.append(target)
+    
+    except zipfile.BadZipFile:
+        return saved, "File is not a valid ZIP file"
+    
+    if not saved:
+        return saved, "The ZIP contains no PDF or image statements"
+    return saved, None